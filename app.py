@@ -5,12 +5,18 @@ LINE 接龍機器人
 2. 工作認養排班：直接貼入排班表 → Bot 自動解析並編號，成員用 +編號 姓名 報名
 """
 
+import io
+import itertools
 import os
 import re
 import json
 import sqlite3
 import logging
 import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timedelta
 
 from flask import Flask, request, abort
@@ -53,7 +59,47 @@ GROUP_LINE_RE      = re.compile(r'^\s*([^\d\s：:、，,]+?)[：:]\s*(.+)$')  #
 SESSION_TIME_RE    = re.compile(r'^\s*(上午|下午)\s+[\d:–\-]+(?:\s*[-–]\s*[\d:]+)?\s*[：:](.+)')  # 「上午 8:00-12:30：碧月」
 BARE_NAME_RE       = re.compile(r'^\s*([\u4e00-\u9fff]{1,6})\s*$')  # 單行裸名「秀美」
 MULTI_NAME_RE      = re.compile(r'^\s*([\u4e00-\u9fff]{1,6}(?:[、，,][\u4e00-\u9fff]{1,6})+)\s*$')  # 多人裸名「美芬、慧珍」
-_SESSIONS = {'上午', '下午'}
+NAME_SPLIT_RE      = re.compile(r'[、，,]')  # 多人名單分隔符
+_SESSIONS = frozenset({'上午', '下午'})
+
+# ── 指令判斷用正規表示式（模組載入時編譯一次）
+OPEN_CMD_RE    = re.compile(r"[/]?(?:接龍|開團)\s+\S")      # 「接龍 名稱」
+JOIN_CMD_RE    = re.compile(r"\+\d+(\s|$)")                 # 「+3」「+3 小明」
+LEAVE_CMD_RE   = re.compile(r"(退出|取消)(\s+\d+.*)?$")     # 「退出」「退出 3 小明」
+JOIN_PARSE_RE  = re.compile(r"\+(\d+)\s*(.*)")              # 排班報名：編號 + 姓名
+SIMPLE_JOIN_RE = re.compile(r"\+\d*\s*(.*)")                # 簡易報名：+N 之後的內容
+LEAVE_SLOT_RE  = re.compile(r"(?:退出|取消)\s+(\d+)\s*(.*)")  # 退出指定項目
+OPEN_PARSE_RE  = re.compile(r"[/]?(?:接龍|開團)\s*(.*)")      # 開團：取出名稱
+PLUS_NUM_RE    = re.compile(r"\+(\d+)")                      # 多項報名：每個 +N
+TITLE_TAIL_RE  = re.compile(r"[：:如下\s]+$")                 # 標題結尾的「如下：」
+
+# ── 其餘指令（CMD 用於 handle_message 分派，PARSE 用於指令函式取值）
+DOT_NUM_RE        = re.compile(r"(\d+)[\.．]")                # 多項報名：每個 N.
+DOT_STRIP_RE      = re.compile(r"\d+[\.．]\s*")               # 多項報名：去掉 N. 留下姓名
+DOT_JOIN_CMD_RE   = re.compile(r"\d+[\.．]\s*\S")             # 「3. 小明」
+DOT_JOIN_PARSE_RE = re.compile(r"(\d+)[\.．]\s*(.*)")
+DATE_PREVIEW_RE   = re.compile(r"(\d{1,2}/\d{1,2})\s*工作提醒$")  # 「3/22 工作提醒」
+FORCE_CLEAR_RE    = re.compile(r"(?i)force\s+清除\s+\d+$")     # 「force 清除 3」
+FORCE_PREFIX_RE   = re.compile(r"(?i)^force\s+")
+CLEAR_CMD_RE      = re.compile(r"清除\s+\d+$")
+CLEAR_PARSE_RE    = re.compile(r"清除\s+(\d+)")
+PROXY_CMD_RE      = re.compile(r"幫報\s+\d+\s+\S")
+PROXY_PARSE_RE    = re.compile(r"幫報\s+(\d+)\s+(.+)")
+REMOVE_CMD_RE     = re.compile(r"移除\s+\d+\s+\S")
+REMOVE_PARSE_RE   = re.compile(r"移除\s+(\d+)\s+(.+)")
+RENAME_CMD_RE     = re.compile(r"更改\s+\d+\s+\S+\s+\S")
+RENAME_PARSE_RE   = re.compile(r"更改\s+(\d+)\s+(\S+)\s+(\S+)")
+SHORT_DATE_RE     = re.compile(r"\d{1,2}/\d{1,2}")
+EMOJI_ONLY_RE     = re.compile(r'^[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\s]+$')
+
+# ── 推播設定指令
+SET_TIME_CMD_RE       = re.compile(r"設定推播\s+\d")
+SET_TIME_PARSE_RE     = re.compile(r"設定推播\s+(\d{1,2})(?:[：:](\d{2}))?$")
+SET_QUIET_CMD_RE      = re.compile(r"設定靜音\s+\d+\s+\d+$")
+SET_QUIET_PARSE_RE    = re.compile(r"設定靜音\s+(\d{1,2})\s+(\d{1,2})$")
+SET_THRESHOLD_RE      = re.compile(r"設定推播門檻\s+(\d+)$")
+SET_INTERVAL_CMD_RE   = re.compile(r"設定推播間隔\s+\d")
+SET_INTERVAL_PARSE_RE = re.compile(r"設定推播間隔\s+(\d+(?:\.\d+)?)$")
 
 HELP_TEXT = """📖 接龍指令說明
 ━━━━━━━━━━━━━━
@@ -96,12 +142,14 @@ def init_db():
     if db_dir and not os.path.exists(db_dir):
         try:
             os.makedirs(db_dir, exist_ok=True)
-            logger.info(f"[startup] 建立資料庫目錄: {db_dir}")
+            logger.info("[startup] 建立資料庫目錄: %s", db_dir)
         except OSError as e:
-            logger.warning(f"[startup] 無法建立 {db_dir}: {e}，改用當前目錄")
+            logger.warning("[startup] 無法建立 %s: %s，改用當前目錄", db_dir, e)
             DB_PATH = "jielong.db"
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
+    # WAL 寫入檔頭後永久生效；讀取不再被寫入阻擋
+    c.execute("PRAGMA journal_mode=WAL")
 
     c.execute("""
         CREATE TABLE IF NOT EXISTS lists (
@@ -144,6 +192,7 @@ def init_db():
             session        TEXT,
             required_count INTEGER DEFAULT 1,
             note           TEXT,
+            label          TEXT,
             FOREIGN KEY (list_id) REFERENCES lists (id)
         )
     """)
@@ -166,21 +215,41 @@ def init_db():
         "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", defaults
     )
 
-    # 相容舊資料庫：補欄位（已存在時靜默忽略）
+    # 相容舊資料庫：補欄位（先查 PRAGMA table_info，只對缺少的欄位 ALTER）
+    columns = {
+        tbl: {row[1] for row in c.execute(f"PRAGMA table_info({tbl})")}
+        for tbl in ("lists", "entries", "slots")
+    }
+    for tbl, col, decl in [
+        ("lists",   "list_type",            "TEXT      DEFAULT 'simple'"),
+        ("lists",   "last_broadcast_at",    "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("lists",   "last_broadcast_count", "INTEGER   DEFAULT 0"),
+        ("entries", "slot_num",             "INTEGER"),
+        ("entries", "registered_by",        "TEXT"),
+        ("entries", "group_name",           "TEXT"),
+        ("slots",   "label",                "TEXT"),
+    ]:
+        if col not in columns[tbl]:
+            c.execute(f"ALTER TABLE {tbl} ADD COLUMN {col} {decl}")
+
+    # 常用查詢條件的索引（需在補欄位之後建立）
+    # (list_id, slot_num, user_name) 同時涵蓋 (list_id, slot_num) 的查詢，取代舊的窄索引
     for sql in [
-        "ALTER TABLE lists   ADD COLUMN list_type            TEXT      DEFAULT 'simple'",
-        "ALTER TABLE lists   ADD COLUMN last_broadcast_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
-        "ALTER TABLE lists   ADD COLUMN last_broadcast_count INTEGER   DEFAULT 0",
-        "ALTER TABLE entries ADD COLUMN slot_num             INTEGER",
-        "ALTER TABLE entries ADD COLUMN registered_by        TEXT",
-        "ALTER TABLE entries ADD COLUMN group_name           TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_lists_group_status     ON lists   (group_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_list_slot_name ON entries (list_id, slot_num, user_name)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_list_user      ON entries (list_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_list_seq       ON entries (list_id, seq)",
+        "CREATE INDEX IF NOT EXISTS idx_slots_list             ON slots   (list_id, slot_num)",
+        "DROP INDEX IF EXISTS idx_entries_list_slot",
     ]:
-        try:
-            c.execute(sql)
-        except Exception:
-            pass
+        c.execute(sql)
+
+    # 索引建立後若從未統計過（舊資料庫第一次升級），跑一次 ANALYZE 讓查詢規劃器選對索引
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone():
+        c.execute("ANALYZE")
 
     conn.commit()
+    reload_settings(conn)
     conn.close()
 
 
@@ -188,74 +257,171 @@ def init_db():
 # 資料庫輔助函式
 # ══════════════════════════════════════════
 
+_db_local = threading.local()
+
+class _ThreadConn:
+    """放在 _db_local 裡的連線容器：執行緒結束時 threading.local 清掉它，連線隨之關閉
+    （python app.py 的 Werkzeug 每個請求一條新執行緒，不關會一直累積連線與檔案描述符）；
+    程式結束時仍存活的長駐執行緒連線，由 weakref.finalize 的 atexit 關閉，讓 WAL 正常 checkpoint"""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+        weakref.finalize(self, conn.close)
+
+# 熱門查詢只取程式會讀的欄位（以欄位名稱存取），順序固定，不受舊資料庫 ALTER 補欄位順序影響
+# 推播時間／筆數只在 SQL 內使用，不取回 Python
+LIST_COLS  = "id, group_id, title, creator_id, creator_name, status, list_type"
+ENTRY_COLS = "id, user_id, user_name, item, quantity, seq"
+SLOT_COLS  = "id, list_id, slot_num, date_str, day_str, activity, time_str, session, required_count, note, label"
+# slots 與 entries JOIN 時用的同一組欄位（加上別名 s.），由 SLOT_COLS 產生，兩者不會不同步
+SLOT_COLS_S = ", ".join(f"s.{col}" for col in SLOT_COLS.split(", "))
+
+_db_ready      = False   # 本 process 是否已執行過 init_db
+_db_ready_lock = threading.Lock()
+
+def _ensure_db():
+    """確認資料表已建立（每個 process 只執行一次 init_db），get_conn() 開新連線前呼叫
+    通常由 _startup() 的背景執行緒先完成；若以 `gunicorn app:app` 啟動而沒有載入 gunicorn_config.py，
+    post_worker_init 不會執行，改在第一次查詢時同步初始化並補啟動背景維護"""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if _db_ready:
+            return
+        init_db()
+        _db_ready = True
+    if _startup():
+        logger.warning("[startup] 未經 gunicorn_config.py 啟動（post_worker_init 未執行），已於第一次查詢時初始化資料庫")
+
+def get_conn():
+    """取得目前執行緒共用的 SQLite 連線（第一次使用時開啟並設定 PRAGMA）
+    寫入請包在 `with conn:` 內，離開時一次 COMMIT，例外則 ROLLBACK。"""
+    holder = getattr(_db_local, "holder", None)
+    if holder is None:
+        _ensure_db()   # init_db 可能改寫 DB_PATH，必須在開連線之前
+        # cached_statements：常用 SQL 的預編譯結果保留在連線上，重複查詢不必再解析
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row   # 可用 row["title"] 具名存取，也保留 row[0] 位置存取
+        # journal_mode=WAL 由 init_db 寫入檔頭後永久生效，這裡只設定每條連線的 PRAGMA
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA cache_size=-20000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=134217728")   # 128MB：讀取直接走記憶體映射，少一次 read() 複製
+        _db_local.holder = holder = _ThreadConn(conn)
+    return holder.conn
+
+
+def begin_write(conn):
+    """在 `with conn:` 內第一個呼叫：立即取得寫入鎖（BEGIN IMMEDIATE），
+    讓「先查重複／額滿再寫入」在同一個交易內完成，不會被其他執行緒插隊"""
+    conn.execute("BEGIN IMMEDIATE")
+
+
+# ── 進行中接龍快取：group_id → (版本, 到期時間, row)
+#    開團／結團／取消／重開 COMMIT 後以 _invalidate_active() 換新版本；查詢前先記下版本，
+#    查詢途中有人開團／結團時版本已變，存入的舊 row 不會被命中（做法同「列表」文字快取）
+_active_cache   = {}
+_active_version = {}
+_active_counter = itertools.count(1)
+_ACTIVE_TTL     = 30   # 秒
+
 def get_active_list(group_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    version = _active_version.get(group_id, 0)
+    hit     = _active_cache.get(group_id)
+    if hit and hit[0] == version and hit[1] > time.monotonic():
+        return hit[2]
+    c = get_conn().cursor()
     c.execute(
-        'SELECT * FROM lists WHERE group_id=? AND status="open" ORDER BY id DESC LIMIT 1',
+        f'SELECT {LIST_COLS} FROM lists WHERE group_id=? AND status="open" ORDER BY id DESC LIMIT 1',
         (group_id,),
     )
     row = c.fetchone()
-    conn.close()
-    return row  # cols: id,group_id,title,creator_id,creator_name,status,created_at,list_type
+    _active_cache[group_id] = (version, time.monotonic() + _ACTIVE_TTL, row)
+    return row
+
+def _invalidate_active(group_id):
+    _active_version[group_id] = next(_active_counter)
+    _active_cache.pop(group_id, None)
+
+# ── 「列表」文字快取：group_id → (list_id, 版本, 到期時間, 文字)
+#    報名資料異動時以 _touch_list_text() 換新版本；查詢前先記下版本，
+#    查詢途中有人寫入時版本已變，存入的舊文字不會被命中
+_list_text_cache   = {}
+_list_text_version = {}
+_list_text_counter = itertools.count(1)
+_LIST_TEXT_TTL     = 30   # 秒（多 worker 時其他 process 的寫入最多延遲這麼久）
+
+def _touch_list_text(group_id):
+    _list_text_version[group_id] = next(_list_text_counter)
 
 def get_all_schedules(group_id):
     """取得該群組所有排班型接龍（不限 open/closed），供工作提醒使用"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_conn().cursor()
     c.execute(
-        'SELECT * FROM lists WHERE group_id=? AND list_type="schedule" ORDER BY id DESC',
+        f'SELECT {LIST_COLS} FROM lists WHERE group_id=? AND list_type="schedule" ORDER BY id DESC',
         (group_id,),
     )
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    return c.fetchall()
 
 def _list_type(active):
-    return active[7] if active and len(active) > 7 else "simple"
+    return active["list_type"] if active else "simple"
 
 def get_entries(list_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM entries WHERE list_id=? ORDER BY seq", (list_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c = get_conn().cursor()
+    c.execute(f"SELECT {ENTRY_COLS} FROM entries WHERE list_id=? ORDER BY seq", (list_id,))
+    return c.fetchall()
 
 def get_slots(list_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM slots WHERE list_id=? ORDER BY slot_num", (list_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows  # id,list_id,slot_num,date_str,day_str,activity,time_str,session,required_count,note
+    c = get_conn().cursor()
+    c.execute(f"SELECT {SLOT_COLS} FROM slots WHERE list_id=? ORDER BY slot_num", (list_id,))
+    return c.fetchall()
 
 def get_slot_signups(list_id):
     """回傳 {slot_num: [name, ...]} 的 dict"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_conn().cursor()
     c.execute(
         "SELECT slot_num, user_name FROM entries WHERE list_id=? AND slot_num IS NOT NULL ORDER BY id",
         (list_id,),
     )
     rows = c.fetchall()
-    conn.close()
     result = {}
     for snum, uname in rows:
         result.setdefault(snum, []).append(uname or "（未知）")
     return result
 
+def get_schedule_view(list_id):
+    """一次 LEFT JOIN 取回排班項目與報名名單，回傳 (slots, {slot_num: [name, ...]})
+    等同 get_slots() + get_slot_signups()，但只查一次資料庫"""
+    c = get_conn().cursor()
+    c.execute(
+        f"SELECT {SLOT_COLS_S}, e.id AS entry_id, e.user_name AS entry_name"
+        " FROM slots s"
+        " LEFT JOIN entries e ON e.list_id=s.list_id AND e.slot_num=s.slot_num"
+        " WHERE s.list_id=? ORDER BY s.slot_num, e.id",
+        (list_id,),
+    )
+    slots   = []
+    signups = {}
+    for row in c.fetchall():
+        # 前 11 欄與 get_slots() 相同，整列直接當作 slot 使用
+        if not slots or slots[-1]["id"] != row["id"]:
+            slots.append(row)
+        if row["entry_id"] is not None:
+            signups.setdefault(row["slot_num"], []).append(row["entry_name"] or "（未知）")
+    return slots, signups
+
 def get_slot_signups_with_group(list_id):
     """回傳 {slot_num: {group_name_or_empty: [name, ...]}}，供工作提醒分群顯示"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_conn().cursor()
     c.execute(
         "SELECT slot_num, group_name, user_name FROM entries"
         " WHERE list_id=? AND slot_num IS NOT NULL ORDER BY id",
         (list_id,),
     )
     rows = c.fetchall()
-    conn.close()
     result = {}
     for snum, gname, uname in rows:
         d = result.setdefault(snum, {})
@@ -264,47 +430,47 @@ def get_slot_signups_with_group(list_id):
     return result
 
 def get_all_active_lists():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT * FROM lists WHERE status="open"')
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c = get_conn().cursor()
+    c.execute(f'SELECT {LIST_COLS} FROM lists WHERE status="open"')
+    return c.fetchall()
+
+# ── 推播設定快取：設定很少變動，啟動時整表載入，set_setting 寫入後同步更新
+_SETTINGS_CACHE = {}
+_SETTINGS_LOCK  = threading.Lock()
+
+def reload_settings(conn=None):
+    """從資料庫重新載入全部設定到快取"""
+    rows = (conn or get_conn()).execute("SELECT key, value FROM settings").fetchall()
+    with _SETTINGS_LOCK:
+        _SETTINGS_CACHE.clear()
+        _SETTINGS_CACHE.update((k, v) for k, v in rows)
 
 def get_setting(key, default=""):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key=?", (key,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else default
+    if not _SETTINGS_CACHE:   # init_db 之前或尚未載入
+        reload_settings()
+    return _SETTINGS_CACHE.get(key, default)
 
 def set_setting(key, value):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+    with _SETTINGS_LOCK:
+        _SETTINGS_CACHE[key] = str(value)
 
 def get_entry_count(list_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_conn().cursor()
     c.execute("SELECT COUNT(*) FROM entries WHERE list_id=?", (list_id,))
-    count = c.fetchone()[0]
-    conn.close()
-    return count
+    return c.fetchone()[0]
 
 def update_broadcast_state(list_id):
     """推播完成後，更新 last_broadcast_at 及 last_broadcast_count"""
     count = get_entry_count(list_id)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "UPDATE lists SET last_broadcast_at=CURRENT_TIMESTAMP, last_broadcast_count=? WHERE id=?",
-        (count, list_id),
-    )
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with conn:
+        conn.execute(
+            "UPDATE lists SET last_broadcast_at=CURRENT_TIMESTAMP, last_broadcast_count=? WHERE id=?",
+            (count, list_id),
+        )
 
 def is_broadcast_allowed():
     """台灣時間在允許時段內才推播（預設 07:00–22:00）"""
@@ -313,15 +479,24 @@ def is_broadcast_allowed():
     allow_end   = int(get_setting("allow_end",   "22"))
     return allow_start <= hour < allow_end
 
+# ── LINE 顯示名稱快取：(group_id, user_id) → (到期時間, 名稱)，避免每次報名都打 profile API
+_name_cache = {}
+_NAME_TTL   = 3600   # 秒
+
 def get_user_name(event, group_id, user_id):
+    key = (group_id, user_id)
+    hit = _name_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
     try:
         if event.source.type == "group":
             profile = line_bot_api.get_group_member_profile(group_id, user_id)
         else:
             profile = line_bot_api.get_profile(user_id)
-        return profile.display_name
     except Exception:
-        return None
+        return None   # 失敗不快取，下次再試
+    _name_cache[key] = (time.monotonic() + _NAME_TTL, profile.display_name)
+    return profile.display_name
 
 def source_id(event):
     src = event.source
@@ -331,18 +506,12 @@ def source_id(event):
         return src.room_id
     return src.user_id
 
+_FW_TABLE = {c: c - 0xFEE0 for c in range(0xFF01, 0xFF5F)}  # 全形 ！～ → 半形 !~
+_FW_TABLE[0x3000] = 0x20                                      # 全形空格 → 半形空格
+
 def normalize(text):
     """全形英數符號 → 半形（處理中文輸入法輸入的 ＋、１２３ 等）"""
-    result = []
-    for ch in text:
-        code = ord(ch)
-        if 0xFF01 <= code <= 0xFF5E:   # 全形 ！～ → 半形 !~
-            result.append(chr(code - 0xFEE0))
-        elif ch == '\u3000':            # 全形空格 → 半形空格
-            result.append(' ')
-        else:
-            result.append(ch)
-    return ''.join(result)
+    return text.translate(_FW_TABLE)
 
 
 # ══════════════════════════════════════════
@@ -351,20 +520,22 @@ def normalize(text):
 
 def is_schedule_post(text):
     """含有至少 1 個日期行（3/1（日）格式）視為排班表"""
-    return len(DATE_RE.findall(text)) >= 1
+    # 先用字元檢查擋掉一般聊天訊息（日期格式必含「/」與括號），找到第一個日期即可，不必 findall 全文
+    return ("/" in text and ("（" in text or "(" in text)
+            and DATE_RE.search(text) is not None)
 
 
 _TITLE_SKIP = re.compile(r'^[/]?(?:接龍|開團)\s*$|^親愛的|^大家好|^平安|^各位|^Hello|^嗨')
 
 def _extract_title(text):
     """從排班表文字中萃取有意義的標題，跳過問候語和接龍關鍵字"""
-    for line in text.strip().split("\n")[:12]:
+    for line in text.strip().split("\n", 12)[:12]:   # 只切前 12 行，不必切完整篇
         line = line.strip()
         if not line or DATE_RE.search(line):
             continue
         if _TITLE_SKIP.search(line):
             continue
-        title = re.sub(r'[：:如下\s]+$', '', line).strip()
+        title = TITLE_TAIL_RE.sub('', line).strip()
         if title:
             return title
     return "工作認養排班"
@@ -382,20 +553,28 @@ def parse_schedule_slots(text):
     slots     = []
     prefilled = {}   # slot_num → [name, ...]
     slot_num  = 1
-    lines     = text.split("\n")
 
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        date_match = DATE_RE.search(line)
-
-        if not date_match:
-            i += 1
+    # 一次 finditer 找出所有區段起點：每行只取第一個日期，跨行的匹配不算
+    anchors  = []   # [(date_match, 該行結尾位置)]
+    line_end = -1
+    for m in DATE_RE.finditer(text):
+        if m.start() <= line_end or "\n" in m.group():
             continue
+        line_end = text.find("\n", m.end())
+        if line_end < 0:
+            line_end = len(text)
+        anchors.append((m, line_end))
 
+    for k, (date_match, line_end) in enumerate(anchors):
         date_str = date_match.group(1)
         day_str  = date_match.group(2)
-        after    = line[date_match.end():].strip()
+        after    = text[date_match.end():line_end].strip()
+        # 後續內容：到下一個日期所在行之前（遇空行另外截斷）
+        if k + 1 < len(anchors):
+            body_end = text.rfind("\n", 0, anchors[k + 1][0].start()) + 1
+        else:
+            body_end = len(text)
+        body = text[line_end + 1:body_end]
 
         # 萃取人數
         count_match = COUNT_RE.search(after)
@@ -418,18 +597,17 @@ def parse_schedule_slots(text):
         prefill_names      = []   # 編號列表預填：['小白']（無群組）
         group_prefill_names = []  # 群組預填：[('德中', '欣萍'), ('林華', '濰嬣'), ...]
 
-        # 掃描後續行，直到空行或下一個日期
-        j = i + 1
-        while j < len(lines):
-            nl = lines[j].strip()
+        # 掃描後續行，直到空行
+        for nl in body.split("\n"):
+            nl = nl.strip()
             if not nl:
-                j += 1
-                break
-            if DATE_RE.search(nl):
                 break
 
+            # 三種時段格式都必須含「上午／下午」，先做字串檢查，沒有就不跑這些正規表示式
+            has_sess = "上午" in nl or "下午" in nl
+
             # 優先嘗試「群組 上午：姓名」格式（如「林華 上午：淑瓊」）
-            gsm = GROUP_SESSION_RE.match(nl)
+            gsm = GROUP_SESSION_RE.match(nl) if has_sess else None
             if gsm:
                 grp       = gsm.group(1)
                 sess      = gsm.group(2)
@@ -441,7 +619,8 @@ def parse_schedule_slots(text):
                     session_names[sess] = name_part
             else:
                 # 「上午 8:00-12:30：碧月」— 時段含時間，優先於 SESSION_RE 和 TIME_RE
-                stm = SESSION_TIME_RE.match(nl)
+                stm = SESSION_TIME_RE.match(nl) if has_sess else None
+                sm  = SESSION_RE.match(nl) if has_sess and not stm else None
                 if stm:
                     sess      = stm.group(1)
                     name_part = stm.group(2).strip()
@@ -449,15 +628,14 @@ def parse_schedule_slots(text):
                         sessions.append(sess)
                     if name_part:
                         session_names[sess] = name_part
-                elif SESSION_RE.match(nl):
-                    sm = SESSION_RE.match(nl)
+                elif sm:
                     sess      = sm.group(1)
                     name_part = sm.group(2).strip().lstrip(':：').strip()
                     if sess not in sessions:
                         sessions.append(sess)
                     if name_part:
                         session_names[sess] = name_part
-                elif TIME_RE.search(nl) and not time_str:
+                elif not time_str and ":" in nl and TIME_RE.search(nl):
                     time_str = nl.strip()
                 else:
                     # 嘗試「群組名：姓名、姓名」格式（如「德中：欣萍、琇環、梅淑」）
@@ -465,7 +643,7 @@ def parse_schedule_slots(text):
                     if glm and glm.group(1) not in _SESSIONS:
                         grp       = glm.group(1)
                         names_str = glm.group(2)
-                        names     = [n.strip() for n in re.split(r'[、，,]', names_str) if n.strip()]
+                        names     = [n.strip() for n in NAME_SPLIT_RE.split(names_str) if n.strip()]
                         for name in names:
                             group_prefill_names.append((grp, name))
                     else:
@@ -489,11 +667,10 @@ def parse_schedule_slots(text):
                                     mnm = MULTI_NAME_RE.match(nl)
                                     if mnm:
                                         prefill_names.extend(
-                                            n.strip() for n in re.split(r'[、，,]', mnm.group(1)) if n.strip()
+                                            n.strip() for n in NAME_SPLIT_RE.split(mnm.group(1)) if n.strip()
                                         )
                                     else:
                                         note_parts.append(nl)
-            j += 1
 
         note = " ".join(note_parts).strip()
 
@@ -535,8 +712,6 @@ def parse_schedule_slots(text):
                 prefilled[sn] = all_prefill
             slot_num += 1
 
-        i = j
-
     return slots, prefilled
 
 
@@ -544,84 +719,98 @@ def parse_schedule_slots(text):
 # 格式化顯示
 # ══════════════════════════════════════════
 
+SEP = "─" * 16   # 名單標題與內容之間的分隔線
+
+
 def _is_strict_slot(slot):
     """判斷此項目是否嚴格限制人數（只有「值班」類工作才限額）"""
-    activity = (slot[5] or "").lower()
+    activity = (slot["activity"] or "").lower()
     return "值班" in activity
 
 
 def _slot_label(slot):
-    """slot tuple → 單行文字，如「3/18（三）苓雅共修處值班 上午」"""
-    date_str = slot[3]
-    day_str  = slot[4]
-    activity = slot[5]
-    time_str = slot[6]
-    session  = slot[7]
-    label = f"{date_str}（{day_str}）{activity}"
-    if session:
-        label += f" {session}"
-    if time_str:
-        label += f" {time_str}"
-    return label
+    """slot row → 單行文字；建立時已存入 label 欄位，舊資料（label 為 NULL）才現場組字"""
+    return slot["label"] or _build_slot_label(slot)
+
+
+def _build_slot_label(slot):
+    """slot row / dict → 單行文字，如「3/18（三）苓雅共修處值班 上午」"""
+    return _label_text(slot["date_str"], slot["day_str"], slot["activity"],
+                       slot["time_str"], slot["session"])
+
+
+@lru_cache(maxsize=4096)
+def _label_text(date_str, day_str, activity, time_str, session):
+    # 以欄位值為 key 快取；內容相同結果就相同，重建排班表不需清除
+    return (f"{date_str}（{day_str}）{activity}"
+            f"{' ' + session if session else ''}"
+            f"{' ' + time_str if time_str else ''}")
 
 
 def format_schedule_list(list_row, slots, signups, *, show_time=False):
-    title   = list_row[2]
-    creator = list_row[4] or "負責人"
-    lines   = [f"📋 {title}", f"（負責人：{creator}）"]
+    title   = list_row["title"]
+    creator = list_row["creator_name"] or "負責人"
+    # 直接寫入同一個緩衝區，不另外累積行清單
+    buf = io.StringIO()
+    w   = buf.write
+    w(f"📋 {title}\n（負責人：{creator}）\n")
     if show_time:
         now = datetime.now(TZ_TAIPEI).strftime("%Y/%m/%d %H:%M")
-        lines.append(f"🕖 更新：{now}")
-    lines.append("─" * 16)
+        w(f"🕖 更新：{now}\n")
+    w(SEP)
 
     for s in slots:
-        slot_num = s[2]
-        required = s[8]
-        header   = f"【{slot_num}】{_slot_label(s)}"
-        names = signups.get(slot_num, [])
-        current = len(names)
-        if required > 1:
-            header += f"（{current}/{required}人）"
-        lines.append(header)
-        if names:
-            # 編號人名，4人一行：1.美芬 2.美玲 3.碧雲 4.淑惠
-            numbered = [f"{i+1}.{n}" for i, n in enumerate(names)]
-            for row_start in range(0, len(numbered), 4):
-                row = numbered[row_start:row_start+4]
-                lines.append("   " + " ".join(row))
-        else:
-            lines.append("   （尚無人報名）")
+        for line in _fmt_slot(s, signups):
+            w("\n")
+            w(line)
 
-    return "\n".join(lines)
+    return buf.getvalue()
+
+
+def _fmt_slot(s, signups):
+    """單一工作項目的顯示行：標題（含人數）＋ 報名名單"""
+    slot_num = s["slot_num"]
+    required = s["required_count"]
+    names    = signups.get(slot_num, [])
+    if required > 1:
+        yield f"【{slot_num}】{_slot_label(s)}（{len(names)}/{required}人）"
+    else:
+        yield f"【{slot_num}】{_slot_label(s)}"
+    if names:
+        # 編號人名，4人一行：1.美芬 2.美玲 3.碧雲 4.淑惠
+        numbered = [f"{i+1}.{n}" for i, n in enumerate(names)]
+        for row_start in range(0, len(numbered), 4):
+            yield "   " + " ".join(numbered[row_start:row_start+4])
+    else:
+        yield "   （尚無人報名）"
 
 
 def format_list(list_row, entries, *, show_time=False):
-    title   = list_row[2]
-    creator = list_row[4] or "開團者"
+    title   = list_row["title"]
+    creator = list_row["creator_name"] or "開團者"
     lines   = [f"📋 {title}", f"（開團：{creator}）"]
     if show_time:
         now = datetime.now(TZ_TAIPEI).strftime("%Y/%m/%d %H:%M")
         lines.append(f"🕖 更新時間：{now}")
-    lines.append("─" * 16)
+    lines.append(SEP)
 
     if not entries:
         lines.append("（尚無人加入）")
     else:
-        for e in entries:
-            seq       = e[6]
-            disp_name = e[3] or "匿名"
-            item      = e[4] or ""
-            quantity  = e[5] or ""
-            parts = [f"{seq}. {disp_name}"]
-            if item:
-                parts.append(item)
-            if quantity:
-                parts.append(quantity)
-            lines.append(" ".join(parts))
+        lines.extend(_fmt_entry(e) for e in entries)
 
     return "\n".join(lines)
 
 
+def _fmt_entry(e):
+    """簡易接龍單行：「3. 小明 早班 8:00-12:00」（項目、備註空白時省略）"""
+    item     = e["item"]
+    quantity = e["quantity"]
+    return (f"{e['seq']}. {e['user_name'] or '匿名'}"
+            f"{' ' + item if item else ''}"
+            f"{' ' + quantity if quantity else ''}")
+
+
 # ══════════════════════════════════════════
 # 推播核心
 # ══════════════════════════════════════════
@@ -630,11 +819,14 @@ def _is_all_filled(lst):
     """判斷接龍是否所有工作都已認領完畢（不需要再推播）"""
     if _list_type(lst) != "schedule":
         return False  # 簡易接龍無法判斷，持續推播
-    slots   = get_slots(lst[0])
-    signups = get_slot_signups(lst[0])
+    return _slots_all_filled(*get_schedule_view(lst["id"]))
+
+
+def _slots_all_filled(slots, signups):
+    """已取得的排班資料是否全部認領完畢（值班類需滿額，其餘至少 1 人）"""
     for s in slots:
-        sn       = s[2]
-        required = s[8]
+        sn       = s["slot_num"]
+        required = s["required_count"]
         current  = len(signups.get(sn, []))
         if _is_strict_slot(s) and current < required:
             return False
@@ -645,24 +837,23 @@ def _is_all_filled(lst):
 
 def _push_list(lst, prefix=""):
     """對單一接龍推播名單，成功後更新推播狀態"""
-    group_id = lst[1]
+    group_id = lst["group_id"]
     ltype    = _list_type(lst)
 
     if ltype == "schedule":
-        slots   = get_slots(lst[0])
-        signups = get_slot_signups(lst[0])
+        slots, signups = get_schedule_view(lst["id"])
         body    = format_schedule_list(lst, slots, signups, show_time=True)
     else:
-        entries = get_entries(lst[0])
+        entries = get_entries(lst["id"])
         body    = format_list(lst, entries, show_time=True)
 
     message = f"{prefix}\n\n{body}".strip() if prefix else body
     try:
         line_bot_api.push_message(group_id, TextSendMessage(text=message))
-        logger.info(f"[broadcast] 推播至 {group_id}：{lst[2]}")
-        update_broadcast_state(lst[0])
+        logger.info("[broadcast] 推播至 %s：%s", group_id, lst["title"])
+        update_broadcast_state(lst["id"])
     except Exception as e:
-        logger.error(f"[broadcast] 推播失敗 {group_id}：{e}")
+        logger.error("[broadcast] 推播失敗 %s：%s", group_id, e)
 
 
 def daily_broadcast():
@@ -673,11 +864,11 @@ def daily_broadcast():
         return
 
     now_str = datetime.now(TZ_TAIPEI).strftime("%Y/%m/%d")
-    logger.info(f"[排程] 早安推播 {len(active_lists)} 個接龍")
+    logger.info("[排程] 早安推播 %d 個接龍", len(active_lists))
     prefix = f"📣 早安！以下是今日工作認養名單（{now_str}）"
     for lst in active_lists:
         if _is_all_filled(lst):
-            logger.info(f"[排程] 全部認領完畢，跳過推播：{lst[2]}")
+            logger.info("[排程] 全部認領完畢，跳過推播：%s", lst["title"])
             continue
         _push_list(lst, prefix)
 
@@ -687,52 +878,70 @@ def check_timed_broadcast():
     if not is_broadcast_allowed():
         return
 
-    active_lists = get_all_active_lists()
-    now = datetime.now(TZ_TAIPEI)
+    # 距上次推播的小時數交給 SQLite 計算（last_broadcast_at 為 UTC 的 CURRENT_TIMESTAMP）
+    # 空值 → 視為 7 小時前；無法解析 → 0（跳過）
+    c = get_conn().cursor()
+    c.execute(
+        f"SELECT {LIST_COLS},"
+        " CASE WHEN last_broadcast_at IS NULL OR last_broadcast_at = '' THEN 7"
+        "      ELSE COALESCE((julianday('now') - julianday(last_broadcast_at)) * 24, 0)"
+        " END AS elapsed_hours"
+        ' FROM lists WHERE status="open"'
+    )
+    active_lists = c.fetchall()
+    interval = float(get_setting("interval_hours", "6"))
 
     for lst in active_lists:
         if _is_all_filled(lst):
             continue
-        last_at_str = lst[8]  # last_broadcast_at
-        if last_at_str:
-            try:
-                last_at = datetime.strptime(last_at_str, "%Y-%m-%d %H:%M:%S")
-                last_at = pytz.utc.localize(last_at).astimezone(TZ_TAIPEI)
-            except Exception:
-                last_at = now  # 解析失敗則跳過
-        else:
-            last_at = now - timedelta(hours=7)  # None → 視為很久以前
-
-        interval = float(get_setting("interval_hours", "6"))
-        elapsed_hours = (now - last_at).total_seconds() / 3600
-        if elapsed_hours >= interval:
-            logger.info(f"[排程] 6 小時定時推播：{lst[2]}")
+        if lst["elapsed_hours"] >= interval:
+            logger.info("[排程] 6 小時定時推播：%s", lst["title"])
             _push_list(lst, "📋 定時更新")
 
 
-def _check_all_filled_notify(list_id, group_id, lst=None):
-    """報名後檢查：全部認領完畢時推播通知"""
-    if lst is None:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT * FROM lists WHERE id=?", (list_id,))
-        lst = c.fetchone()
-        conn.close()
-    if not lst or lst[5] != "open":
+# 額滿通知在背景執行：報名回覆不必等 LINE push（100–300ms）
+# 同一接龍尚未執行的通知只排一次，執行時會讀到最新狀態
+_notify_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notify")
+_notify_pending  = set()
+_notify_lock     = threading.Lock()
+
+def _notify_all_filled_async(list_id, group_id):
+    with _notify_lock:
+        if list_id in _notify_pending:
+            return
+        _notify_pending.add(list_id)
+    _notify_executor.submit(_run_all_filled_notify, list_id, group_id)
+
+def _run_all_filled_notify(list_id, group_id):
+    with _notify_lock:
+        _notify_pending.discard(list_id)
+    try:
+        _check_all_filled_notify(list_id, group_id)
+    except Exception as e:
+        logger.error("[通知] 檢查失敗 %s: %s", group_id, e)
+
+
+def _check_all_filled_notify(list_id, group_id):
+    """報名後檢查：全部認領完畢時推播通知
+    接龍狀態一律在這裡重新查詢，不用呼叫端手上的 row（可能來自快取，報名後才被結團／取消）"""
+    c = get_conn().cursor()
+    c.execute(f"SELECT {LIST_COLS} FROM lists WHERE id=?", (list_id,))
+    lst = c.fetchone()
+    if not lst or lst["status"] != "open" or _list_type(lst) != "schedule":
         return
-    if not _is_all_filled(lst):
+    # 排班資料只查一次：同時用來判斷是否額滿與組推播內容
+    slots, signups = get_schedule_view(list_id)
+    if not _slots_all_filled(slots, signups):
         return
 
-    logger.info(f"[通知] 全部認領完畢：{lst[2]}")
-    slots   = get_slots(list_id)
-    signups = get_slot_signups(list_id)
+    logger.info("[通知] 全部認領完畢：%s", lst["title"])
     body    = format_schedule_list(lst, slots, signups, show_time=True)
     total   = sum(len(v) for v in signups.values())
     message = f"🎉 所有工作都已認領完畢！\n\n{body}\n\n共 {total} 人報名"
     try:
         line_bot_api.push_message(group_id, TextSendMessage(text=message))
     except Exception as e:
-        logger.error(f"[通知] 推播失敗 {group_id}: {e}")
+        logger.error("[通知] 推播失敗 %s: %s", group_id, e)
 
 
 ## vacancy_reminder 已移除 — 空缺提醒改為手動輸入「空缺」查詢
@@ -760,21 +969,21 @@ def _preview_for_date(group_id, target_date, header):
 
     matched = []
     for sch in schedules:
-        list_id = sch[0]
+        list_id = sch["id"]
         slots   = get_slots(list_id)
         signups = get_slot_signups_with_group(list_id)
         for s in slots:
-            dt = _parse_slot_date(s[3])
+            dt = _parse_slot_date(s["date_str"])
             if dt and dt == target_date:
-                matched.append((s, signups, sch[2]))
+                matched.append((s, signups, sch["title"]))
 
     if not matched:
         return f"{target_date.strftime('%m/%d')} 沒有排班項目。"
 
     lines = [header, "─" * 8]
     for s, signups, title in matched:
-        sn       = s[2]
-        required = s[8]
+        sn       = s["slot_num"]
+        required = s["required_count"]
         groups   = signups.get(sn, {})
         current  = sum(len(v) for v in groups.values())
         label    = f"【{sn}】{_slot_label(s)}"
@@ -829,22 +1038,22 @@ def cmd_weekly_preview(group_id):
 
     matched = []
     for sch in schedules:
-        list_id = sch[0]
+        list_id = sch["id"]
         slots   = get_slots(list_id)
         signups = get_slot_signups_with_group(list_id)
         for s in slots:
-            dt = _parse_slot_date(s[3])
+            dt = _parse_slot_date(s["date_str"])
             if dt and next_monday <= dt <= next_sunday:
-                matched.append((s, signups, sch[2]))
+                matched.append((s, signups, sch["title"]))
 
     if not matched:
         return f"下週（{next_monday.strftime('%m/%d')}–{next_sunday.strftime('%m/%d')}）沒有排班項目。"
 
     header = f"📅 下週工作預告（{next_monday.strftime('%m/%d')}–{next_sunday.strftime('%m/%d')}）"
-    lines  = [header, "─" * 16]
+    lines  = [header, SEP]
     for s, signups, title in matched:
-        sn       = s[2]
-        required = s[8]
+        sn       = s["slot_num"]
+        required = s["required_count"]
         groups   = signups.get(sn, {})
         current  = sum(len(v) for v in groups.values())
         label    = f"【{sn}】{_slot_label(s)}"
@@ -862,7 +1071,7 @@ def cmd_weekly_preview(group_id):
 
         lines.append(label)
 
-    lines.append("─" * 16)
+    lines.append(SEP)
     return "\n".join(lines)
 
 
@@ -870,15 +1079,27 @@ def cmd_weekly_preview(group_id):
 # 指令處理
 # ══════════════════════════════════════════
 
+def _open_new_list(conn, group_id, title, user_id, user_name, list_type):
+    """關閉該群組進行中的接龍並建立新接龍，回傳新 list_id
+    呼叫端負責包在 `with conn:` 內（與後續寫入同一個交易），完成後清除 active 快取"""
+    conn.execute('UPDATE lists SET status="closed" WHERE group_id=? AND status="open"', (group_id,))
+    c = conn.execute(
+        "INSERT INTO lists (group_id, title, creator_id, creator_name, list_type, last_broadcast_at, last_broadcast_count)"
+        " VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 0)",
+        (group_id, title, user_id, user_name, list_type),
+    )
+    return c.lastrowid
+
+
 def cmd_post_schedule(group_id, user_id, user_name, text):
     """解析排班表並建立排班型接龍（有進行中的接龍時，僅負責人可重建）"""
     # 檢查是否有進行中的接龍
     existing = get_active_list(group_id)
-    if existing and existing[3] != user_id:
+    if existing and existing["creator_id"] != user_id:
         # 若所有工作已認領完畢，允許其他人開新接龍
         if not _is_all_filled(existing):
-            creator_name = existing[4] or "負責人"
-            return f"⚠️ 目前已有進行中的接龍「{existing[2]}」\n只有負責人（{creator_name}）可以重建排班表。"
+            creator_name = existing["creator_name"] or "負責人"
+            return f"⚠️ 目前已有進行中的接龍「{existing['title']}」\n只有負責人（{creator_name}）可以重建排班表。"
 
     slots, prefilled = parse_schedule_slots(text)
     if not slots:
@@ -886,40 +1107,35 @@ def cmd_post_schedule(group_id, user_id, user_name, text):
 
     title = _extract_title(text)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
 
-    # 重貼排班表 = 全部覆蓋，不保留舊報名
-    c.execute('UPDATE lists SET status="closed" WHERE group_id=? AND status="open"', (group_id,))
-    c.execute(
-        "INSERT INTO lists (group_id, title, creator_id, creator_name, list_type, last_broadcast_at, last_broadcast_count)"
-        " VALUES (?, ?, ?, ?, 'schedule', CURRENT_TIMESTAMP, 0)",
-        (group_id, title, user_id, user_name),
-    )
-    list_id = c.lastrowid
-
-    new_slot_nums = set()
-    for s in slots:
-        new_slot_nums.add(s["slot_num"])
-        c.execute(
-            "INSERT INTO slots (list_id,slot_num,date_str,day_str,activity,time_str,session,required_count,note)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (list_id, s["slot_num"], s["date_str"], s["day_str"], s["activity"],
-             s["time_str"], s["session"], s["required_count"], s["note"]),
+    # 整份排班表在同一個交易內寫入（一次 COMMIT）
+    with conn:
+        # 重貼排班表 = 全部覆蓋，不保留舊報名
+        list_id = _open_new_list(conn, group_id, title, user_id, user_name, "schedule")
+
+        c.executemany(
+            "INSERT INTO slots (list_id,slot_num,date_str,day_str,activity,time_str,session,required_count,note,label)"
+            " VALUES (?,?,?,?,?,?,?,?,?,?)",
+            [
+                (list_id, s["slot_num"], s["date_str"], s["day_str"], s["activity"],
+                 s["time_str"], s["session"], s["required_count"], s["note"], _build_slot_label(s))
+                for s in slots
+            ],
         )
 
-    # 將排班表中已填寫的姓名預先寫入 entries
-    for sn, entries in prefilled.items():
-        for grp, name in entries:
-            proxy_uid = f"__prefill__{sn}__{name}"
-            c.execute(
-                "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by, group_name)"
-                " VALUES (?, ?, ?, ?, ?, '__prefilled__', ?)",
-                (list_id, proxy_uid, name, sn, sn, grp),
-            )
-
-    conn.commit()
-    conn.close()
+        # 將排班表中已填寫的姓名預先寫入 entries
+        c.executemany(
+            "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by, group_name)"
+            " VALUES (?, ?, ?, ?, ?, '__prefilled__', ?)",
+            [
+                (list_id, f"__prefill__{sn}__{name}", name, sn, sn, grp)
+                for sn, entries in prefilled.items()
+                for grp, name in entries
+            ],
+        )
+    _invalidate_active(group_id)
 
     is_rebuild = bool(existing)
     header = "🔄 排班表已重建！" if is_rebuild else "✅ 排班表已建立！"
@@ -927,11 +1143,7 @@ def cmd_post_schedule(group_id, user_id, user_name, text):
     lines.append("─────────────────")
     for s in slots:
         sn    = s["slot_num"]
-        label = f"【{sn}】{s['date_str']}（{s['day_str']}）{s['activity']}"
-        if s["session"]:
-            label += f" {s['session']}"
-        if s["time_str"]:
-            label += f" {s['time_str']}"
+        label = f"【{sn}】{_build_slot_label(s)}"
         if s["required_count"] > 1:
             label += f" {s['required_count']}人"
         # 顯示預填姓名
@@ -953,19 +1165,13 @@ def cmd_post_schedule(group_id, user_id, user_name, text):
 
 def cmd_open(group_id, user_id, user_name, text):
     """簡易接龍"""
-    m = re.match(r"[/]?(?:接龍|開團)\s*(.*)", text)
+    m = OPEN_PARSE_RE.match(text)
     title = (m.group(1).strip() if m else "").strip() or "工作接龍"
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE lists SET status="closed" WHERE group_id=? AND status="open"', (group_id,))
-    c.execute(
-        "INSERT INTO lists (group_id, title, creator_id, creator_name, last_broadcast_at, last_broadcast_count)"
-        " VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, 0)",
-        (group_id, title, user_id, user_name),
-    )
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with conn:
+        _open_new_list(conn, group_id, title, user_id, user_name, "simple")
+    _invalidate_active(group_id)
 
     return (
         f"✅ 接龍已開始！\n"
@@ -993,9 +1199,9 @@ def cmd_join(group_id, user_id, user_name, text):
 
 def _join_slot(group_id, user_id, user_name, text, active):
     """排班模式：+3 小明 → 報名第 3 號工作（支援 +3 小明 小華 家和 多人報名）"""
-    list_id = active[0]
+    list_id = active["id"]
 
-    m = re.match(r"\+(\d+)\s*(.*)", text)
+    m = JOIN_PARSE_RE.match(text)
     if not m:
         return "請輸入 + 編號 空格 你的名字\n\n例如：+3 王小明\n\n先輸入「列表」看有哪些工作可以報名"
 
@@ -1003,80 +1209,82 @@ def _join_slot(group_id, user_id, user_name, text, active):
     name_part = m.group(2).strip()
     names     = name_part.split() if name_part else [user_name or "（未知）"]
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
 
     # 確認 slot 存在
-    c.execute("SELECT * FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
+    c.execute(f"SELECT {SLOT_COLS} FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
     slot = c.fetchone()
     if not slot:
-        conn.close()
         return f"找不到第 {slot_num} 號工作項目。\n\n請先輸入「列表」查看有哪些工作可以報名。"
 
-    required = slot[8]
+    required = slot["required_count"]
 
-    # 單人報名走簡化流程
+    # 單人報名走簡化流程：重複與額滿檢查併入同一個條件式 INSERT
     if len(names) == 1:
         name = names[0]
-        c.execute(
-            "SELECT id FROM entries WHERE list_id=? AND user_name=? AND slot_num=?",
-            (list_id, name, slot_num),
-        )
-        existing = c.fetchone()
-        if existing:
-            conn.close()
-            return f"⚠️ {name} 已報名 {slot_num}. {_slot_label(slot)}"
+        with conn:
+            c.execute(
+                "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq)"
+                " SELECT :list_id, :user_id, :name, :slot_num, :slot_num"
+                " WHERE NOT EXISTS (SELECT 1 FROM entries"
+                "                   WHERE list_id=:list_id AND user_name=:name AND slot_num=:slot_num)"
+                "   AND (NOT :strict OR (SELECT COUNT(*) FROM entries"
+                "                        WHERE list_id=:list_id AND slot_num=:slot_num) < :required)",
+                {"list_id": list_id, "user_id": user_id, "name": name, "slot_num": slot_num,
+                 "strict": _is_strict_slot(slot), "required": required},
+            )
+            inserted = c.rowcount == 1
 
-        if _is_strict_slot(slot):
+        if not inserted:
+            # 沒寫入 → 判斷是重複報名還是額滿（只在失敗時多查一次）
             c.execute(
-                "SELECT COUNT(*) FROM entries WHERE list_id=? AND slot_num=?",
-                (list_id, slot_num),
+                "SELECT id FROM entries WHERE list_id=? AND user_name=? AND slot_num=?",
+                (list_id, name, slot_num),
             )
-            if c.fetchone()[0] >= required:
-                conn.close()
-                return f"❌ 第 {slot_num} 號已額滿（{required} 人）！"
+            if c.fetchone():
+                return f"⚠️ {name} 已報名 {slot_num}. {_slot_label(slot)}"
+            return f"❌ 第 {slot_num} 號已額滿（{required} 人）！"
 
-        c.execute(
-            "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq) VALUES (?, ?, ?, ?, ?)",
-            (list_id, user_id, name, slot_num, slot_num),
-        )
-        conn.commit()
-        conn.close()
-        _check_all_filled_notify(list_id, group_id, active)
+        _touch_list_text(group_id)
+        _notify_all_filled_async(list_id, group_id)
         return f"✅ 報名成功！\n【{slot_num}】{_slot_label(slot)} → {name}\n\n輸入「列表」可查看完整名單"
 
-    # 多人報名
+    # 多人報名：已報名姓名與人數只查一次，逐一判斷後一次寫入
+    strict  = _is_strict_slot(slot)
     results = []
-    any_inserted = False
-    for name in names:
+    rows    = []
+    with conn:
+        begin_write(conn)
         c.execute(
-            "SELECT id FROM entries WHERE list_id=? AND user_name=? AND slot_num=?",
-            (list_id, name, slot_num),
+            "SELECT user_name FROM entries WHERE list_id=? AND slot_num=?",
+            (list_id, slot_num),
         )
-        if c.fetchone():
-            results.append(f"⚠️ {name}（已報名）")
-            continue
+        existing = [r[0] for r in c.fetchall()]
+        taken    = set(existing)
+        count    = len(existing)
 
-        if _is_strict_slot(slot):
-            c.execute(
-                "SELECT COUNT(*) FROM entries WHERE list_id=? AND slot_num=?",
-                (list_id, slot_num),
-            )
-            if c.fetchone()[0] >= required:
+        for name in names:
+            if name in taken:
+                results.append(f"⚠️ {name}（已報名）")
+                continue
+            if strict and count >= required:
                 results.append(f"❌ {name}（已額滿）")
                 continue
+            rows.append((list_id, user_id, name, slot_num, slot_num))
+            taken.add(name)
+            count += 1
+            results.append(f"✅ {name}")
 
-        c.execute(
+        c.executemany(
             "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq) VALUES (?, ?, ?, ?, ?)",
-            (list_id, user_id, name, slot_num, slot_num),
+            rows,
         )
-        results.append(f"✅ {name}")
-        any_inserted = True
+    any_inserted = bool(rows)
 
-    conn.commit()
-    conn.close()
     if any_inserted:
-        _check_all_filled_notify(list_id, group_id, active)
+        _touch_list_text(group_id)
+        _notify_all_filled_async(list_id, group_id)
 
     header = f"📋 【{slot_num}】{_slot_label(slot)} 報名結果："
     return header + "\n" + "\n".join(results)
@@ -1084,9 +1292,9 @@ def _join_slot(group_id, user_id, user_name, text, active):
 
 def _join_simple(group_id, user_id, user_name, text, active):
     """簡易接龍模式：+1 名字 項目 數量"""
-    list_id = active[0]
+    list_id = active["id"]
 
-    m    = re.match(r"\+\d*\s*(.*)", text)
+    m    = SIMPLE_JOIN_RE.match(text)
     rest = m.group(1).strip() if m else text[1:].strip()
     parts = rest.split(None, 2)
     if not parts:
@@ -1096,29 +1304,33 @@ def _join_simple(group_id, user_id, user_name, text, active):
     item       = parts[1] if len(parts) > 1 else ""
     quantity   = parts[2] if len(parts) > 2 else ""
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
-    c.execute("SELECT id, seq FROM entries WHERE list_id=? AND user_id=?", (list_id, user_id))
-    existing = c.fetchone()
-
-    if existing:
-        c.execute(
-            "UPDATE entries SET user_name=?, item=?, quantity=? WHERE id=?",
-            (entry_name, item, quantity, existing[0]),
-        )
-        seq   = existing[1]
-        reply = f"✏️ 已更新！（第 {seq} 號）"
-    else:
-        c.execute("SELECT MAX(seq) FROM entries WHERE list_id=?", (list_id,))
-        seq = (c.fetchone()[0] or 0) + 1
+    with conn:
+        begin_write(conn)
+        # 已報名 → 直接更新並取回原本的編號；沒有更新到任何列才新增
         c.execute(
-            "INSERT INTO entries (list_id, user_id, user_name, item, quantity, seq) VALUES (?, ?, ?, ?, ?, ?)",
-            (list_id, user_id, entry_name, item, quantity, seq),
+            "UPDATE entries SET user_name=?, item=?, quantity=?"
+            " WHERE id=(SELECT id FROM entries WHERE list_id=? AND user_id=? LIMIT 1) RETURNING seq",
+            (entry_name, item, quantity, list_id, user_id),
         )
-        reply = f"✅ 已加入！你是第 {seq} 號"
+        updated = c.fetchall()
+
+        if updated:
+            seq   = updated[0][0]
+            reply = f"✏️ 已更新！（第 {seq} 號）"
+        else:
+            # 編號在同一條 INSERT 內算出（BEGIN IMMEDIATE 已持有寫入鎖，不會撞號）
+            c.execute(
+                "INSERT INTO entries (list_id, user_id, user_name, item, quantity, seq)"
+                " VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM entries WHERE list_id=?))"
+                " RETURNING seq",
+                (list_id, user_id, entry_name, item, quantity, list_id),
+            )
+            seq   = c.fetchall()[0][0]
+            reply = f"✅ 已加入！你是第 {seq} 號"
+    _touch_list_text(group_id)
 
-    conn.commit()
-    conn.close()
     return reply + "\n（輸入「列表」隨時查看）"
 
 
@@ -1130,58 +1342,71 @@ def cmd_join_multi(group_id, user_id, user_name, text):
     if _list_type(active) != "schedule":
         return "多項報名只適用於排班模式。\n格式：+1 +3 +5 你的名字"
 
-    slot_nums = [int(x) for x in re.findall(r'\+(\d+)', text)]
-    name_part = re.sub(r'\+\d+', '', text).strip()
+    slot_nums = [int(x) for x in PLUS_NUM_RE.findall(text)]
+    name_part = PLUS_NUM_RE.sub('', text).strip()
     names = name_part.split() if name_part else [user_name or "（未知）"]
 
-    list_id = active[0]
-    conn = sqlite3.connect(DB_PATH)
+    list_id = active["id"]
+    conn = get_conn()
     c = conn.cursor()
 
     results = []
-    any_inserted = False
-
-    for name in names:
-        for slot_num in slot_nums:
-            c.execute("SELECT * FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
-            slot = c.fetchone()
-            if not slot:
-                results.append(f"❌ {name}：第 {slot_num} 號不存在")
-                continue
+    rows    = []
 
-            required = slot[8]
+    # 一次取回所有指定的 slot
+    wanted       = sorted(set(slot_nums))
+    placeholders = ",".join("?" * len(wanted))
+    c.execute(
+        f"SELECT {SLOT_COLS} FROM slots WHERE list_id=? AND slot_num IN ({placeholders})",
+        (list_id, *wanted),
+    )
+    slot_map = {row["slot_num"]: row for row in c.fetchall()}
 
-            # 同一姓名重複報名 → 跳過
-            c.execute(
-                "SELECT id FROM entries WHERE list_id=? AND user_name=? AND slot_num=?",
-                (list_id, name, slot_num),
-            )
-            if c.fetchone():
-                results.append(f"⚠️ {name}：【{slot_num}】已報名")
-                continue
+    with conn:
+        begin_write(conn)
+        # 這些 slot 已報名的姓名與人數一次取回，之後在記憶體中判斷重複／額滿
+        c.execute(
+            f"SELECT slot_num, user_name FROM entries WHERE list_id=? AND slot_num IN ({placeholders})",
+            (list_id, *wanted),
+        )
+        taken  = set()
+        counts = {}
+        for sn, uname in c.fetchall():
+            taken.add((sn, uname))
+            counts[sn] = counts.get(sn, 0) + 1
 
-            # 額滿檢查（僅值班類工作限額）
-            if _is_strict_slot(slot):
-                c.execute(
-                    "SELECT COUNT(*) FROM entries WHERE list_id=? AND slot_num=?",
-                    (list_id, slot_num),
-                )
-                if c.fetchone()[0] >= required:
+        for name in names:
+            for slot_num in slot_nums:
+                slot = slot_map.get(slot_num)
+                if not slot:
+                    results.append(f"❌ {name}：第 {slot_num} 號不存在")
+                    continue
+
+                required = slot["required_count"]
+
+                # 同一姓名重複報名 → 跳過
+                if (slot_num, name) in taken:
+                    results.append(f"⚠️ {name}：【{slot_num}】已報名")
+                    continue
+
+                # 額滿檢查（僅值班類工作限額）
+                if _is_strict_slot(slot) and counts.get(slot_num, 0) >= required:
                     results.append(f"❌ {name}：【{slot_num}】已額滿（{required}人）")
                     continue
 
-            c.execute(
-                "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq) VALUES (?, ?, ?, ?, ?)",
-                (list_id, user_id, name, slot_num, slot_num),
-            )
-            results.append(f"✅ {name}：【{slot_num}】{_slot_label(slot)}")
-            any_inserted = True
+                rows.append((list_id, user_id, name, slot_num, slot_num))
+                taken.add((slot_num, name))
+                counts[slot_num] = counts.get(slot_num, 0) + 1
+                results.append(f"✅ {name}：【{slot_num}】{_slot_label(slot)}")
 
-    conn.commit()
-    conn.close()
+        c.executemany(
+            "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
 
-    if any_inserted:
-        _check_all_filled_notify(list_id, group_id, active)
+    if rows:
+        _touch_list_text(group_id)
+        _notify_all_filled_async(list_id, group_id)
 
     name_display = "、".join(names)
     return f"📋 {name_display} 報名結果：\n" + "\n".join(results)
@@ -1195,51 +1420,50 @@ def cmd_proxy_join(group_id, user_id, user_name, text):
     if _list_type(active) != "schedule":
         return "幫報功能只適用於排班模式。"
 
-    m = re.match(r"幫報\s+(\d+)\s+(.+)", text)
+    m = PROXY_PARSE_RE.match(text)
     if not m:
         return "格式：幫報 [編號] [姓名]\n例：幫報 3 小明"
 
-    list_id  = active[0]
+    list_id  = active["id"]
     slot_num = int(m.group(1))
     name     = m.group(2).strip()
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
 
-    c.execute("SELECT * FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
+    c.execute(f"SELECT {SLOT_COLS} FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
     slot = c.fetchone()
     if not slot:
-        conn.close()
         return f"找不到第 {slot_num} 號工作項目。\n\n請先輸入「列表」查看有哪些工作可以報名。"
 
-    required = slot[8]
-
-    # 同一姓名已在此 slot → 提示重複
-    c.execute(
-        "SELECT id FROM entries WHERE list_id=? AND slot_num=? AND user_name=?",
-        (list_id, slot_num, name),
-    )
-    if c.fetchone():
-        conn.close()
-        return f"❌ {name} 已在第 {slot_num} 號工作中了。"
-
-    # 檢查額滿（僅值班類工作限額）
-    if _is_strict_slot(slot):
-        c.execute("SELECT COUNT(*) FROM entries WHERE list_id=? AND slot_num=?", (list_id, slot_num))
-        if c.fetchone()[0] >= required:
-            conn.close()
-            return f"❌ 第 {slot_num} 號已額滿（{required} 人）！"
+    required = slot["required_count"]
 
     # 用特殊 user_id 避免跟操作者自己的報名衝突
     proxy_uid = f"__proxy__{slot_num}__{name}"
-    c.execute(
-        "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by)"
-        " VALUES (?, ?, ?, ?, ?, ?)",
-        (list_id, proxy_uid, name, slot_num, slot_num, user_id),
-    )
-    conn.commit()
-    conn.close()
-    _check_all_filled_notify(list_id, group_id)
+    with conn:
+        begin_write(conn)
+        # 一次查出此 slot 的報名人數與同名筆數
+        c.execute(
+            "SELECT COUNT(*), COALESCE(SUM(user_name=?), 0) FROM entries WHERE list_id=? AND slot_num=?",
+            (name, list_id, slot_num),
+        )
+        current, same_name = c.fetchone()
+
+        # 同一姓名已在此 slot → 提示重複
+        if same_name:
+            return f"❌ {name} 已在第 {slot_num} 號工作中了。"
+
+        # 檢查額滿（僅值班類工作限額）
+        if _is_strict_slot(slot) and current >= required:
+            return f"❌ 第 {slot_num} 號已額滿（{required} 人）！"
+
+        c.execute(
+            "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (list_id, proxy_uid, name, slot_num, slot_num, user_id),
+        )
+    _touch_list_text(group_id)
+    _notify_all_filled_async(list_id, group_id)
     operator = user_name or "代報者"
     return f"✅ 已代替 {name} 報名！\n【{slot_num}】{_slot_label(slot)} → {name}\n（由 {operator} 代報）"
 
@@ -1270,7 +1494,7 @@ def cmd_show_settings():
 
 def cmd_set_broadcast_time(text):
     """設定推播 HH:MM — 修改早安推播時間並即時生效"""
-    m = re.match(r"設定推播\s+(\d{1,2})(?:[：:](\d{2}))?$", text)
+    m = SET_TIME_PARSE_RE.match(text)
     if not m:
         return "格式：設定推播 HH:MM\n例：設定推播 08:00\n例：設定推播 7"
     hour   = int(m.group(1))
@@ -1286,7 +1510,7 @@ def cmd_set_broadcast_time(text):
 
 def cmd_set_quiet(text):
     """設定靜音 HH HH — 修改靜音時段（靜音開始 靜音結束）"""
-    m = re.match(r"設定靜音\s+(\d{1,2})\s+(\d{1,2})$", text)
+    m = SET_QUIET_PARSE_RE.match(text)
     if not m:
         return "格式：設定靜音 [靜音開始小時] [靜音結束小時]\n例：設定靜音 22 7\n（表示 22:00 至隔天 07:00 靜音）"
     end_quiet   = int(m.group(1))  # allow_end（靜音開始）
@@ -1301,7 +1525,7 @@ def cmd_set_quiet(text):
 
 def cmd_set_threshold(text):
     """設定推播門檻 N — 修改活動觸發推播的新增筆數"""
-    m = re.match(r"設定推播門檻\s+(\d+)$", text)
+    m = SET_THRESHOLD_RE.match(text)
     if not m:
         return "格式：設定推播門檻 [筆數]\n例：設定推播門檻 10"
     n = int(m.group(1))
@@ -1313,7 +1537,7 @@ def cmd_set_threshold(text):
 
 def cmd_set_interval(text):
     """設定推播間隔 N — 修改定時推播間隔小時"""
-    m = re.match(r"設定推播間隔\s+(\d+(?:\.\d+)?)$", text)
+    m = SET_INTERVAL_PARSE_RE.match(text)
     if not m:
         return "格式：設定推播間隔 [小時]\n例：設定推播間隔 4"
     n = float(m.group(1))
@@ -1331,38 +1555,36 @@ def cmd_clear_slot(group_id, user_id, text, force=False):
     active = get_active_list(group_id)
     if not active:
         return "目前沒有進行中的接龍。"
-    if not force and active[3] != user_id:
-        creator_name = active[4] or "負責人"
+    if not force and active["creator_id"] != user_id:
+        creator_name = active["creator_name"] or "負責人"
         return f"⚠️ 只有負責人（{creator_name}）才能清除項目。"
     if _list_type(active) != "schedule":
         return "此功能僅適用於排班模式。"
 
-    m = re.match(r"清除\s+(\d+)", text)
+    m = CLEAR_PARSE_RE.match(text)
     slot_num = int(m.group(1))
-    list_id  = active[0]
+    list_id  = active["id"]
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
 
-    c.execute("SELECT * FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
+    c.execute(f"SELECT {SLOT_COLS} FROM slots WHERE list_id=? AND slot_num=?", (list_id, slot_num))
     slot = c.fetchone()
     if not slot:
-        conn.close()
         return f"找不到第 {slot_num} 號工作項目。"
 
     c.execute(
-        "SELECT user_name FROM entries WHERE list_id=? AND slot_num=?",
+        "SELECT user_name FROM entries WHERE list_id=? AND slot_num=? ORDER BY id",
         (list_id, slot_num),
     )
     names = [r[0] for r in c.fetchall()]
 
     if not names:
-        conn.close()
         return f"【{slot_num}】{_slot_label(slot)} 目前沒有人報名。"
 
-    c.execute("DELETE FROM entries WHERE list_id=? AND slot_num=?", (list_id, slot_num))
-    conn.commit()
-    conn.close()
+    with conn:
+        c.execute("DELETE FROM entries WHERE list_id=? AND slot_num=?", (list_id, slot_num))
+    _touch_list_text(group_id)
 
     return (
         f"🗑️ 已清除【{slot_num}】{_slot_label(slot)} 的所有報名\n"
@@ -1376,26 +1598,25 @@ def cmd_admin_remove(group_id, user_id, text):
     active = get_active_list(group_id)
     if not active:
         return "目前沒有進行中的接龍。"
-    if active[3] != user_id:
+    if active["creator_id"] != user_id:
         return "❌ 只有開團者可以使用此指令。"
 
-    m = re.match(r"移除\s+(\d+)\s+(.+)", text)
+    m = REMOVE_PARSE_RE.match(text)
     if not m:
         return "格式：移除 [編號] [姓名]\n例：移除 3 小明"
 
-    list_id  = active[0]
+    list_id  = active["id"]
     slot_num = int(m.group(1))
     name     = m.group(2).strip()
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "DELETE FROM entries WHERE list_id=? AND slot_num=? AND user_name=?",
-        (list_id, slot_num, name),
-    )
+    conn = get_conn()
+    with conn:
+        c = conn.execute(
+            "DELETE FROM entries WHERE list_id=? AND slot_num=? AND user_name=?",
+            (list_id, slot_num, name),
+        )
     affected = c.rowcount
-    conn.commit()
-    conn.close()
+    _touch_list_text(group_id)
 
     if affected:
         return f"✅ 已移除：第 {slot_num} 號 {name}"
@@ -1408,27 +1629,34 @@ def cmd_admin_rename(group_id, user_id, text):
     active = get_active_list(group_id)
     if not active:
         return "目前沒有進行中的接龍。"
-    if active[3] != user_id:
+    if active["creator_id"] != user_id:
         return "❌ 只有開團者可以使用此指令。"
 
-    m = re.match(r"更改\s+(\d+)\s+(\S+)\s+(\S+)", text)
+    m = RENAME_PARSE_RE.match(text)
     if not m:
         return "格式：更改 [編號] [舊名] [新名]\n例：更改 3 小明 小美"
 
-    list_id  = active[0]
+    list_id  = active["id"]
     slot_num = int(m.group(1))
     old_name = m.group(2).strip()
     new_name = m.group(3).strip()
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "UPDATE entries SET user_name=? WHERE list_id=? AND slot_num=? AND user_name=?",
-        (new_name, list_id, slot_num, old_name),
-    )
-    affected = c.rowcount
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    if old_name == new_name:
+        # 新舊姓名相同：只確認有此人，不必開寫入交易
+        c = conn.execute(
+            "SELECT 1 FROM entries WHERE list_id=? AND slot_num=? AND user_name=? LIMIT 1",
+            (list_id, slot_num, old_name),
+        )
+        affected = c.fetchone() is not None
+    else:
+        with conn:
+            c = conn.execute(
+                "UPDATE entries SET user_name=? WHERE list_id=? AND slot_num=? AND user_name=?",
+                (new_name, list_id, slot_num, old_name),
+            )
+        affected = c.rowcount
+        _touch_list_text(group_id)
 
     if affected:
         return f"✅ 已修改：第 {slot_num} 號 {old_name} → {new_name}"
@@ -1445,29 +1673,31 @@ def cmd_vacancy(group_id):
     if _list_type(active) != "schedule":
         return "此功能僅適用於排班模式的接龍。"
 
-    list_id = active[0]
-    slots   = get_slots(list_id)
-    signups = get_slot_signups(list_id)
-
-    unfilled = []
-    for s in slots:
-        sn       = s[2]
-        required = s[8]
-        current  = len(signups.get(sn, []))
-        if current < required:
-            unfilled.append((s, current, required))
+    list_id = active["id"]
+    # 由 SQLite 彙總每個項目的報名人數，只取回未額滿的項目
+    c = get_conn().cursor()
+    c.execute(
+        f"SELECT {SLOT_COLS_S}, COUNT(e.id) AS signed"
+        " FROM slots s"
+        " LEFT JOIN entries e ON e.list_id=s.list_id AND e.slot_num=s.slot_num"
+        " WHERE s.list_id=?"
+        " GROUP BY s.id HAVING COUNT(e.id) < s.required_count"
+        " ORDER BY s.slot_num",
+        (list_id,),
+    )
+    unfilled = [(s, s["signed"], s["required_count"]) for s in c.fetchall()]
 
     if not unfilled:
-        return f"🎉 {active[2]}\n\n所有工作都已認領完畢！"
+        return f"🎉 {active['title']}\n\n所有工作都已認領完畢！"
 
-    lines = [f"📋 {active[2]}", "以下項目尚未認領，歡迎報名！", "─" * 16]
+    lines = [f"📋 {active['title']}", "以下項目尚未認領，歡迎報名！", SEP]
     for s, current, required in unfilled:
-        sn    = s[2]
+        sn    = s["slot_num"]
         label = f"【{sn}】{_slot_label(s)}"
         if required > 1:
             label += f"  （{current}/{required}人）"
         lines.append(label)
-    lines.append("─" * 16)
+    lines.append(SEP)
     lines.append(f"共 {len(unfilled)} 項空缺")
     return "\n".join(lines)
 
@@ -1477,18 +1707,26 @@ def cmd_list(group_id):
     if not active:
         return "目前沒有進行中的接龍。"
 
+    list_id = active["id"]
+    version = _list_text_version.get(group_id, 0)
+    hit     = _list_text_cache.get(group_id)
+    if hit and hit[0] == list_id and hit[1] == version and hit[2] > time.monotonic():
+        return hit[3]
+
     ltype = _list_type(active)
-    logger.info(f"[cmd_list] list_id={active[0]} list_type={ltype}")
+    logger.info("[cmd_list] list_id=%s list_type=%s", list_id, ltype)
 
     if ltype == "schedule":
-        slots   = get_slots(active[0])
-        signups = get_slot_signups(active[0])
-        logger.info(f"[cmd_list] slots={len(slots)} signups={signups}")
-        return format_schedule_list(active, slots, signups)
+        slots, signups = get_schedule_view(list_id)
+        logger.info("[cmd_list] slots=%d signups=%s", len(slots), signups)
+        text = format_schedule_list(active, slots, signups)
     else:
-        entries = get_entries(active[0])
-        logger.info(f"[cmd_list] entries={len(entries)}")
-        return format_list(active, entries)
+        entries = get_entries(list_id)
+        logger.info("[cmd_list] entries=%d", len(entries))
+        text = format_list(active, entries)
+
+    _list_text_cache[group_id] = (list_id, version, time.monotonic() + _LIST_TEXT_TTL, text)
+    return text
 
 
 def cmd_close(group_id, user_id, force=False):
@@ -1498,28 +1736,26 @@ def cmd_close(group_id, user_id, force=False):
 
     # 只有發起人才能結束接龍（force 模式跳過）
     if not force:
-        creator_id = active[3]
+        creator_id = active["creator_id"]
         if user_id != creator_id:
-            creator_name = active[4] or "發起人"
+            creator_name = active["creator_name"] or "發起人"
             return f"⚠️ 只有發起人（{creator_name}）才能結束接龍。"
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE lists SET status="closed" WHERE id=?', (active[0],))
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with conn:
+        conn.execute('UPDATE lists SET status="closed" WHERE id=?', (active["id"],))
+    _invalidate_active(group_id)
 
     prefix = "🔒 接龍已被強制結束！" if force else "🔒 工作認養已結束！"
     if _list_type(active) == "schedule":
-        slots   = get_slots(active[0])
-        signups = get_slot_signups(active[0])
+        slots, signups = get_schedule_view(active["id"])
         body    = format_schedule_list(active, slots, signups, show_time=True)
         total   = sum(len(v) for v in signups.values())
         return f"{prefix}\n\n{body}\n\n共 {total} 人報名"
     else:
         if not force:
             prefix = "🔒 接龍已結束，以下為最終名單："
-        entries  = get_entries(active[0])
+        entries  = get_entries(active["id"])
         body     = format_list(active, entries, show_time=True)
         return f"{prefix}\n\n{body}\n\n共 {len(entries)} 人報名"
 
@@ -1530,19 +1766,18 @@ def cmd_cancel(group_id, user_id, force=False):
     if not active:
         return "目前沒有進行中的接龍。"
 
-    if not force and active[3] != user_id:
-        creator_name = active[4] or "負責人"
+    if not force and active["creator_id"] != user_id:
+        creator_name = active["creator_name"] or "負責人"
         return f"⚠️ 只有負責人（{creator_name}）才能取消接龍。"
 
-    list_id = active[0]
-    title   = active[2]
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM entries WHERE list_id=?", (list_id,))
-    c.execute("DELETE FROM slots WHERE list_id=?", (list_id,))
-    c.execute("DELETE FROM lists WHERE id=?", (list_id,))
-    conn.commit()
-    conn.close()
+    list_id = active["id"]
+    title   = active["title"]
+    conn = get_conn()
+    with conn:
+        conn.execute("DELETE FROM entries WHERE list_id=?", (list_id,))
+        conn.execute("DELETE FROM slots WHERE list_id=?", (list_id,))
+        conn.execute("DELETE FROM lists WHERE id=?", (list_id,))
+    _invalidate_active(group_id)
 
     return f"🗑️ 接龍「{title}」已取消，所有資料已清除。"
 
@@ -1553,82 +1788,81 @@ def cmd_restart(group_id, user_id, force=False):
     if not active:
         return "目前沒有進行中的接龍。"
 
-    if not force and active[3] != user_id:
-        creator_name = active[4] or "負責人"
+    if not force and active["creator_id"] != user_id:
+        creator_name = active["creator_name"] or "負責人"
         return f"⚠️ 只有負責人（{creator_name}）才能重新開團。"
 
     if _list_type(active) != "schedule":
         return "此功能僅適用於排班模式的接龍。"
 
-    old_list_id  = active[0]
-    title        = active[2]
-    creator_id   = active[3]
-    creator_name = active[4]
+    old_list_id  = active["id"]
+    title        = active["title"]
+    creator_id   = active["creator_id"]
+    creator_name = active["creator_name"]
 
     # 讀取舊的 slots 和報名
-    old_slots = get_slots(old_list_id)
+    old_slots, old_signups = get_schedule_view(old_list_id)
     if not old_slots:
         return "找不到排班資料，無法重新開團。"
 
-    old_signups = get_slot_signups(old_list_id)
-
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     c = conn.cursor()
 
     # 讀取舊報名的完整資料（包含 user_id, registered_by）
     c.execute(
-        "SELECT slot_num, user_id, user_name, registered_by FROM entries WHERE list_id=? AND slot_num IS NOT NULL",
+        "SELECT slot_num, user_id, user_name, registered_by FROM entries"
+        " WHERE list_id=? AND slot_num IS NOT NULL ORDER BY id",
         (old_list_id,),
     )
     old_entries = {}  # {slot_num: [(user_id, user_name, registered_by), ...]}
     for row in c.fetchall():
-        old_entries.setdefault(row[0], []).append((row[1], row[2], row[3]))
+        old_entries.setdefault(row["slot_num"], []).append((row["user_id"], row["user_name"], row["registered_by"]))
 
-    # 關閉舊的
-    c.execute('UPDATE lists SET status="closed" WHERE id=?', (old_list_id,))
+    with conn:
+        # 關閉舊的
+        c.execute('UPDATE lists SET status="closed" WHERE id=?', (old_list_id,))
 
-    # 建立新的（相同排班）
-    c.execute(
-        "INSERT INTO lists (group_id, title, creator_id, creator_name, list_type, last_broadcast_at, last_broadcast_count)"
-        " VALUES (?, ?, ?, ?, 'schedule', CURRENT_TIMESTAMP, 0)",
-        (group_id, title, creator_id, creator_name),
-    )
-    new_list_id = c.lastrowid
-
-    # 複製 slots
-    for s in old_slots:
+        # 建立新的（相同排班）
         c.execute(
-            "INSERT INTO slots (list_id,slot_num,date_str,day_str,activity,time_str,session,required_count,note)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (new_list_id, s[2], s[3], s[4], s[5], s[6], s[7], s[8], s[9]),
+            "INSERT INTO lists (group_id, title, creator_id, creator_name, list_type, last_broadcast_at, last_broadcast_count)"
+            " VALUES (?, ?, ?, ?, 'schedule', CURRENT_TIMESTAMP, 0)",
+            (group_id, title, creator_id, creator_name),
+        )
+        new_list_id = c.lastrowid
+
+        # 複製 slots（同一條預編譯 INSERT 批次執行）
+        c.executemany(
+            "INSERT INTO slots (list_id,slot_num,date_str,day_str,activity,time_str,session,required_count,note,label)"
+            " VALUES (?,?,?,?,?,?,?,?,?,?)",
+            [(new_list_id, s["slot_num"], s["date_str"], s["day_str"], s["activity"],
+              s["time_str"], s["session"], s["required_count"], s["note"], _slot_label(s))
+             for s in old_slots],
         )
 
-    # 保留所有報名資料
-    carried_count = 0
-    for sn, entries in old_entries.items():
-        for uid, uname, reg_by in entries:
-            c.execute(
-                "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by)"
-                " VALUES (?, ?, ?, ?, ?, ?)",
-                (new_list_id, uid, uname, sn, sn, reg_by),
-            )
-            carried_count += 1
-
-    conn.commit()
-    conn.close()
+        # 保留所有報名資料
+        carried = [(new_list_id, uid, uname, sn, sn, reg_by)
+                   for sn, entries in old_entries.items()
+                   for uid, uname, reg_by in entries]
+        c.executemany(
+            "INSERT INTO entries (list_id, user_id, user_name, slot_num, seq, registered_by)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            carried,
+        )
+        carried_count = len(carried)
+    _invalidate_active(group_id)
 
-    lines = [f"🔄 已重新開團！\n📋 {title}\n共 {len(old_slots)} 個工作項目，保留 {carried_count} 筆報名", "─" * 16]
+    lines = [f"🔄 已重新開團！\n📋 {title}\n共 {len(old_slots)} 個工作項目，保留 {carried_count} 筆報名", SEP]
     for s in old_slots:
-        sn = s[2]
+        sn = s["slot_num"]
         label = f"【{sn}】{_slot_label(s)}"
         names = old_signups.get(sn, [])
         if names:
             label += f"：{'、'.join(names)}"
         else:
-            if s[8] > 1:
-                label += f"（共{s[8]}人）"
+            if s["required_count"] > 1:
+                label += f"（共{s['required_count']}人）"
         lines.append(label)
-    lines.append("─" * 16)
+    lines.append(SEP)
     lines.append("💡 用「移除 編號 姓名」刪除錯誤報名，或「清除 編號」清空整個項目")
     return "\n".join(lines)
 
@@ -1638,69 +1872,86 @@ def cmd_leave(group_id, user_id, user_name, text=""):
     if not active:
         return "目前沒有進行中的接龍。"
 
-    list_id = active[0]
+    list_id     = active["id"]
+    is_schedule = _list_type(active) == "schedule"
+    conn = get_conn()
+    c = conn.cursor()
+
+    # 以下各分支都先用唯讀查詢確認有報名紀錄，沒有就直接回覆，
+    # 不開寫入交易（空的 DELETE 也要搶寫入鎖，會擋到同時報名的人）
 
     # 排班模式支援「退出 3」或「退出 3 小明」取消特定項目
-    slot_match = re.match(r"(?:退出|取消)\s+(\d+)\s*(.*)", text)
-    if _list_type(active) == "schedule" and slot_match:
+    slot_match = LEAVE_SLOT_RE.match(text) if is_schedule else None
+    if slot_match:
         slot_num = int(slot_match.group(1))
         name     = slot_match.group(2).strip() or user_name
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        # 先用姓名找，找不到再用 user_id
         c.execute(
-            "DELETE FROM entries WHERE list_id=? AND slot_num=? AND user_name=?",
-            (list_id, slot_num, name),
+            "SELECT 1 FROM entries WHERE list_id=? AND slot_num=? AND (user_name=? OR user_id=?) LIMIT 1",
+            (list_id, slot_num, name, user_id),
         )
-        if c.rowcount == 0:
+        if c.fetchone() is None:
+            return f"找不到 {name} 在第 {slot_num} 號的報名紀錄。"
+        with conn:
+            # 先用姓名找，找不到再用 user_id
             c.execute(
-                "DELETE FROM entries WHERE list_id=? AND user_id=? AND slot_num=?",
-                (list_id, user_id, slot_num),
+                "DELETE FROM entries WHERE list_id=? AND slot_num=? AND user_name=?",
+                (list_id, slot_num, name),
             )
-        affected = c.rowcount
-        conn.commit()
-        conn.close()
+            if c.rowcount == 0:
+                c.execute(
+                    "DELETE FROM entries WHERE list_id=? AND user_id=? AND slot_num=?",
+                    (list_id, user_id, slot_num),
+                )
+            affected = c.rowcount
+        _touch_list_text(group_id)
         if affected:
             return f"✅ 已取消 {name} 在第 {slot_num} 號工作的報名。"
         else:
             return f"找不到 {name} 在第 {slot_num} 號的報名紀錄。"
 
     # 預設：移除該用戶所有報名（用 user_name 或 user_id）
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    if _list_type(active) == "schedule":
-        # 用姓名找
+    if is_schedule:
         c.execute(
-            "SELECT DISTINCT slot_num FROM entries WHERE list_id=? AND user_name=?",
-            (list_id, user_name),
+            "SELECT 1 FROM entries WHERE list_id=? AND (user_name=? OR user_id=?) LIMIT 1",
+            (list_id, user_name, user_id),
         )
-        slot_nums = [r[0] for r in c.fetchall()]
-        if slot_nums:
-            c.execute("DELETE FROM entries WHERE list_id=? AND user_name=?", (list_id, user_name))
-        else:
-            # fallback 用 user_id
+        if c.fetchone() is None:
+            return "找不到你的報名紀錄。"
+        with conn:
+            # 用姓名找；DELETE ... RETURNING 一次刪除並取回被刪的項目編號
             c.execute(
-                "SELECT DISTINCT slot_num FROM entries WHERE list_id=? AND user_id=?",
-                (list_id, user_id),
+                "DELETE FROM entries WHERE list_id=? AND user_name=? RETURNING slot_num",
+                (list_id, user_name),
             )
             slot_nums = [r[0] for r in c.fetchall()]
-            if slot_nums:
-                c.execute("DELETE FROM entries WHERE list_id=? AND user_id=?", (list_id, user_id))
-        conn.commit()
-        conn.close()
+            if not slot_nums:
+                # fallback 用 user_id
+                c.execute(
+                    "DELETE FROM entries WHERE list_id=? AND user_id=? RETURNING slot_num",
+                    (list_id, user_id),
+                )
+                slot_nums = [r[0] for r in c.fetchall()]
+        _touch_list_text(group_id)
+        # 同一項目可能報了多個名額，編號去重（保留順序）
+        slot_nums = list(dict.fromkeys(slot_nums))
         if not slot_nums:
             return "找不到你的報名紀錄。"
         return f"✅ 已取消 {user_name} 在第 {', '.join(str(s) for s in slot_nums)} 號的報名。"
     else:
-        c.execute("SELECT id, seq FROM entries WHERE list_id=? AND user_id=?", (list_id, user_id))
-        existing = c.fetchone()
-        if not existing:
-            conn.close()
+        c.execute("SELECT 1 FROM entries WHERE list_id=? AND user_id=? LIMIT 1", (list_id, user_id))
+        if c.fetchone() is None:
+            return "你不在目前的接龍名單中。"
+        with conn:
+            c.execute(
+                "DELETE FROM entries WHERE id=(SELECT id FROM entries WHERE list_id=? AND user_id=? LIMIT 1)"
+                " RETURNING seq",
+                (list_id, user_id),
+            )
+            removed = c.fetchall()
+        _touch_list_text(group_id)
+        if not removed:
             return "你不在目前的接龍名單中。"
-        c.execute("DELETE FROM entries WHERE id=?", (existing[0],))
-        conn.commit()
-        conn.close()
-        return f"✅ 已將你（第 {existing[1]} 號）從名單中移除。"
+        return f"✅ 已將你（第 {removed[0][0]} 號）從名單中移除。"
 
 
 # ══════════════════════════════════════════
@@ -1721,12 +1972,15 @@ def webhook():
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
 
-    try:
-        events = json.loads(body).get("events", [])
-        for ev in events:
-            logger.info(f"[webhook] type={ev.get('type')} source={ev.get('source',{}).get('type')}")
-    except Exception:
-        logger.info(f"[webhook] raw: {body[:200]}")
+    # 事件摘要只在 DEBUG 時記錄，避免每個請求為了寫 log 多解析一次 JSON（handler 會再解析）
+    if logger.isEnabledFor(logging.DEBUG):
+        # 直接由 Flask 解析原始 bytes（get_data 已快取），不必再解析解碼後的字串
+        payload = request.get_json(force=True, silent=True)
+        try:
+            for ev in payload["events"]:
+                logger.debug("[webhook] type=%s source=%s", ev.get("type"), ev.get("source", {}).get("type"))
+        except Exception:
+            logger.debug("[webhook] raw: %s", body[:200])
 
     try:
         handler.handle(body, signature)
@@ -1734,7 +1988,7 @@ def webhook():
         logger.error("[webhook] Invalid signature")
         abort(400)
     except Exception as e:
-        logger.error(f"[webhook] 處理失敗: {e}")
+        logger.error("[webhook] 處理失敗: %s", e)
     return "OK"
 
 
@@ -1746,11 +2000,10 @@ def _build_nlu_prompt(slots, signups, user_name, text):
     """組裝 NLU prompt，提供排班表資訊讓 Claude 判斷意圖"""
     slot_lines = []
     for s in slots:
-        # s: id, list_id, slot_num, date_str, day_str, activity, time_str, session, required_count, note
-        sn = s[2]
+        sn = s["slot_num"]
         label = _slot_label(s)
         signed = signups.get(sn, [])
-        slot_lines.append(f"  編號{sn}: {label}（需{s[8]}人，已報{len(signed)}人）")
+        slot_lines.append(f"  編號{sn}: {label}（需{s['required_count']}人，已報{len(signed)}人）")
     slots_text = "\n".join(slot_lines)
 
     return f"""目前進行中的接龍排班表：
@@ -1793,22 +2046,25 @@ def _build_nlu_prompt(slots, signups, user_name, text):
 - 不要把發訊息的用戶「{user_name}」也加進 names，除非用戶明確說自己也要報名"""
 
 
+# 報名相關的詞彙（NLU 預先過濾用）
+_JIELONG_KEYWORDS = ('報名', '報', '參加', '認領', '我要', '幫我', '值班',
+                     '明天', '後天', '下周', '下週', '周一', '周二', '周三',
+                     '周四', '周五', '周六', '周日', '星期')
+
+
 def _is_possibly_jielong_related(text, slots):
     """預先過濾：訊息是否可能跟接龍報名有關"""
     # 包含日期格式
-    if re.search(r'\d{1,2}/\d{1,2}', text):
+    if SHORT_DATE_RE.search(text):
         return True
     # 包含排班表中的工作名稱關鍵字
     for s in slots:
-        activity = s[5] or ""
+        activity = s["activity"] or ""
         for keyword in activity.split():
             if len(keyword) >= 2 and keyword in text:
                 return True
     # 包含報名相關的詞彙
-    jielong_keywords = ['報名', '報', '參加', '認領', '我要', '幫我', '值班',
-                        '明天', '後天', '下周', '下週', '周一', '周二', '周三',
-                        '周四', '周五', '周六', '周日', '星期']
-    return any(kw in text for kw in jielong_keywords)
+    return any(kw in text for kw in _JIELONG_KEYWORDS)
 
 
 def cmd_nlu_join(group_id, user_id, user_name, text):
@@ -1820,7 +2076,7 @@ def cmd_nlu_join(group_id, user_id, user_name, text):
     if not active or _list_type(active) != "schedule":
         return None
 
-    list_id = active[0]
+    list_id = active["id"]
     slots = get_slots(list_id)
     if not slots:
         return None
@@ -1844,7 +2100,7 @@ def cmd_nlu_join(group_id, user_id, user_name, text):
             result_text = result_text.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
         result = json.loads(result_text)
     except Exception as e:
-        logger.error(f"[nlu] Claude 呼叫或解析失敗: {e}")
+        logger.error("[nlu] Claude 呼叫或解析失敗: %s", e)
         return None
 
     action = result.get("action")
@@ -1881,166 +2137,152 @@ def cmd_nlu_join(group_id, user_id, user_name, text):
     return None
 
 
+def _cmd_restart_safe(gid, uid, force=False):
+    try:
+        return cmd_restart(gid, uid, force=force)
+    except Exception as e:
+        logger.error("[cmd_restart] 錯誤: %s", e)
+        return "⚠️ 重新開團失敗，請稍後再試。"
+
+
+def _cmd_help(gid, uid):
+    """說明（只有負責人輸入「接龍說明」才顯示；沒有進行中的接龍時任何人皆可）"""
+    active = get_active_list(gid)
+    if active and active["creator_id"] != uid:
+        return "此指令僅限負責人使用。"
+    return HELP_TEXT
+
+
+def _exact(fn, *names):
+    return dict.fromkeys(names, fn)
+
+# 固定字串指令 → handler(gid, uid)；以 text.lower() 查詢（force 指令不分大小寫）
+_EXACT_CMDS = {
+    # 查看名單／空缺
+    **_exact(lambda g, u: cmd_list(g),             "列表", "/列表", "查看", "名單"),
+    **_exact(lambda g, u: cmd_vacancy(g),          "空缺", "缺人", "未認領", "誰沒報"),
+    # 工作提醒（手動觸發）
+    **_exact(lambda g, u: cmd_today_preview(g),    "今日工作提醒", "今天工作提醒", "今日工作", "今天工作"),
+    **_exact(lambda g, u: cmd_tomorrow_preview(g), "明日工作提醒", "明天工作提醒", "明日工作", "明天工作"),
+    **_exact(lambda g, u: cmd_weekly_preview(g),   "下周工作提醒", "下週工作提醒", "下周工作", "下週工作"),
+    # 重新開團（負責人清除報名重來）
+    **_exact(lambda g, u: _cmd_restart_safe(g, u), "重新開團", "重開", "/重新開團"),
+    # force 指令（任何人皆可，跳過負責人檢查）
+    **_exact(lambda g, u: cmd_close(g, u, force=True),         "force close"),
+    **_exact(lambda g, u: cmd_cancel(g, u, force=True),        "force cancel", "force 取消接龍"),
+    **_exact(lambda g, u: _cmd_restart_safe(g, u, force=True), "force restart", "force 重新開團", "force 重開"),
+    # 結束／取消接龍（負責人專用）
+    **_exact(lambda g, u: cmd_close(g, u),         "結束接龍", "結團", "/結束接龍", "/結團", "關閉接龍"),
+    **_exact(lambda g, u: cmd_cancel(g, u),        "取消接龍", "/取消接龍"),
+    # 推播設定／說明
+    **_exact(lambda g, u: cmd_show_settings(),     "推播設定", "/推播設定"),
+    **_exact(_cmd_help,                            "接龍說明"),
+}
+
+# 下面正規表示式分支可能的開頭字元：+N、N.／日期、/接龍、接龍／開團、退出／取消、force、清除、幫報、移除、更改、設定
+_CMD_FIRST_CHARS = frozenset("+/0123456789接開退取fF清幫移更設")
+
+def _may_be_command(text):
+    """一般聊天快速排除：開頭字元不是指令，且不含 +N／N. 多項報名的符號
+    （text 已經過 normalize()，全形 ＋．已轉為半形，不必另外檢查）"""
+    return text[:1] in _CMD_FIRST_CHARS or "+" in text or "." in text
+
+# 退出（支援「退出 3」或「退出 3 小明」取消特定項目）；「退出」「取消」共用
+_LEAVE_CMD = (LEAVE_CMD_RE, lambda g, u, t, e: cmd_leave(g, u, get_user_name(e, g, u), t))
+
+# 以關鍵字開頭的指令 → (格式, handler(gid, uid, text, event))；需要姓名的才以 event 查詢
+# 以第一個詞（text.split()[0].lower()）查詢，格式不符時不回覆
+_PREFIX_CMDS = {
+    "退出":         _LEAVE_CMD,
+    "取消":         _LEAVE_CMD,
+    "force":        (FORCE_CLEAR_RE,      lambda g, u, t, e: cmd_clear_slot(g, u, FORCE_PREFIX_RE.sub("", t), force=True)),
+    "清除":         (CLEAR_CMD_RE,        lambda g, u, t, e: cmd_clear_slot(g, u, t)),
+    "幫報":         (PROXY_CMD_RE,        lambda g, u, t, e: cmd_proxy_join(g, u, get_user_name(e, g, u), t)),
+    "移除":         (REMOVE_CMD_RE,       lambda g, u, t, e: cmd_admin_remove(g, u, t)),
+    "更改":         (RENAME_CMD_RE,       lambda g, u, t, e: cmd_admin_rename(g, u, t)),
+    "設定推播":     (SET_TIME_CMD_RE,     lambda g, u, t, e: cmd_set_broadcast_time(t)),
+    "設定靜音":     (SET_QUIET_CMD_RE,    lambda g, u, t, e: cmd_set_quiet(t)),
+    "設定推播門檻": (SET_THRESHOLD_RE,    lambda g, u, t, e: cmd_set_threshold(t)),
+    "設定推播間隔": (SET_INTERVAL_CMD_RE, lambda g, u, t, e: cmd_set_interval(t)),
+}
+
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     text = normalize(event.message.text.strip())
     gid  = source_id(event)
     uid  = event.source.user_id
 
-    logger.info(f"[msg] text={repr(text[:60])}")
-
-    def lazy_name():
-        return get_user_name(event, gid, uid)
+    logger.info("[msg] text=%r", text[:60])
 
     reply = None
 
+    # ── 固定字串指令：查表直接分派，不必走下面的正規表示式判斷
+    exact = _EXACT_CMDS.get(text.lower())
+    if exact:
+        reply = exact(gid, uid)
+
     # ── 排班表：多行且含日期格式（優先偵測）
-    if "\n" in text and is_schedule_post(text):
-        reply = cmd_post_schedule(gid, uid, lazy_name(), text)
+    elif "\n" in text and is_schedule_post(text):
+        reply = cmd_post_schedule(gid, uid, get_user_name(event, gid, uid), text)
+
+    # ── 一般聊天：不可能是任何指令，跳過下面的正規表示式（仍會走 NLU fallback）
+    elif not _may_be_command(text):
+        pass
 
     # ── 簡易接龍開始
-    elif re.match(r"[/]?(?:接龍|開團)\s+\S", text):
-        reply = cmd_open(gid, uid, lazy_name(), text)
+    elif OPEN_CMD_RE.match(text):
+        reply = cmd_open(gid, uid, get_user_name(event, gid, uid), text)
 
     # ── 多項報名（+1 +3 +5 姓名）
-    elif len(re.findall(r'\+\d+', text)) > 1:
-        reply = cmd_join_multi(gid, uid, lazy_name(), text)
+    elif len(PLUS_NUM_RE.findall(text)) > 1:
+        reply = cmd_join_multi(gid, uid, get_user_name(event, gid, uid), text)
 
     # ── 加入（+N 或 +N 姓名）
-    elif re.match(r"\+\d+(\s|$)", text):
-        reply = cmd_join(gid, uid, lazy_name(), text)
+    elif JOIN_CMD_RE.match(text):
+        reply = cmd_join(gid, uid, get_user_name(event, gid, uid), text)
 
     # ── 多項報名（1. 3. 5. 或 1. 3. 5. 姓名 格式）
-    elif len(re.findall(r'\d+[\.．]', text)) > 1:
+    elif len(DOT_NUM_RE.findall(text)) > 1:
         # 將 "1. 3. 5. 小明" 轉換為 "+1 +3 +5 小明"
-        dot_nums = re.findall(r'(\d+)[\.．]', text)
-        name_part = re.sub(r'\d+[\.．]\s*', '', text).strip()
+        dot_nums = DOT_NUM_RE.findall(text)
+        name_part = DOT_STRIP_RE.sub('', text).strip()
         converted = ' '.join(f'+{n}' for n in dot_nums)
         if name_part:
             converted += f' {name_part}'
-        reply = cmd_join_multi(gid, uid, lazy_name(), converted)
+        reply = cmd_join_multi(gid, uid, get_user_name(event, gid, uid), converted)
 
     # ── 加入（N. 姓名 格式，與列表顯示一致）
-    elif re.match(r"^\d+[\.．]\s*\S", text):
-        m_dot = re.match(r"^(\d+)[\.．]\s*(.*)", text)
-        reply = cmd_join(gid, uid, lazy_name(), f"+{m_dot.group(1)} {m_dot.group(2).strip()}")
-
-    # ── 查看名單
-    elif text in ("列表", "/列表", "查看", "名單"):
-        reply = cmd_list(gid)
-
-    # ── 查看空缺
-    elif text in ("空缺", "缺人", "未認領", "誰沒報"):
-        reply = cmd_vacancy(gid)
-
-    # ── 今日工作提醒
-    elif text in ("今日工作提醒", "今天工作提醒", "今日工作", "今天工作"):
-        reply = cmd_today_preview(gid)
-
-    # ── 明日工作提醒（手動觸發）
-    elif text in ("明日工作提醒", "明天工作提醒", "明日工作", "明天工作"):
-        reply = cmd_tomorrow_preview(gid)
-
-    # ── 下周工作提醒（手動觸發）
-    elif text in ("下周工作提醒", "下週工作提醒", "下周工作", "下週工作"):
-        reply = cmd_weekly_preview(gid)
+    elif DOT_JOIN_CMD_RE.match(text):
+        m_dot = DOT_JOIN_PARSE_RE.match(text)
+        reply = cmd_join(gid, uid, get_user_name(event, gid, uid), f"+{m_dot.group(1)} {m_dot.group(2).strip()}")
 
     # ── 指定日期工作提醒（如「3/22 工作提醒」）
-    elif re.match(r"^\d{1,2}/\d{1,2}\s*工作提醒$", text):
-        ds = re.match(r"^(\d{1,2}/\d{1,2})", text).group(1)
+    elif DATE_PREVIEW_RE.match(text):
+        ds = DATE_PREVIEW_RE.match(text).group(1)
         reply = cmd_date_preview(gid, ds)
 
-    # ── 重新開團（負責人清除報名重來）
-    elif text in ("重新開團", "重開", "/重新開團"):
-        try:
-            reply = cmd_restart(gid, uid)
-        except Exception as e:
-            logger.error(f"[cmd_restart] 錯誤: {e}")
-            reply = "⚠️ 重新開團失敗，請稍後再試。"
-
-    # ── force 指令（任何人皆可，跳過負責人檢查）
-    elif text.lower() == "force close":
-        reply = cmd_close(gid, uid, force=True)
-
-    elif text.lower() in ("force cancel", "force 取消接龍"):
-        reply = cmd_cancel(gid, uid, force=True)
-
-    elif text.lower() in ("force restart", "force 重新開團", "force 重開"):
-        try:
-            reply = cmd_restart(gid, uid, force=True)
-        except Exception as e:
-            logger.error(f"[cmd_restart] 錯誤: {e}")
-            reply = "⚠️ 重新開團失敗，請稍後再試。"
-
-    elif re.match(r"(?i)force\s+清除\s+\d+$", text):
-        force_text = re.sub(r"(?i)^force\s+", "", text)
-        reply = cmd_clear_slot(gid, uid, force_text, force=True)
-
-    # ── 結束
-    elif text in ("結束接龍", "結團", "/結束接龍", "/結團", "關閉接龍"):
-        reply = cmd_close(gid, uid)
-
-    # ── 取消接龍（刪除所有資料，負責人專用）
-    elif text in ("取消接龍", "/取消接龍"):
-        reply = cmd_cancel(gid, uid)
-
-    # ── 退出（支援「退出 3」或「退出 3 小明」取消特定項目）
-    elif re.match(r"(退出|取消)(\s+\d+.*)?$", text):
-        reply = cmd_leave(gid, uid, lazy_name(), text)
-
-    # ── 負責人清除整個項目（清除 3）
-    elif re.match(r"清除\s+\d+$", text):
-        reply = cmd_clear_slot(gid, uid, text)
-
-    # ── 幫報（代替他人報名）
-    elif re.match(r"幫報\s+\d+\s+\S", text):
-        reply = cmd_proxy_join(gid, uid, lazy_name(), text)
-
-    # ── 開團者：移除指定人員
-    elif re.match(r"移除\s+\d+\s+\S", text):
-        reply = cmd_admin_remove(gid, uid, text)
-
-    # ── 開團者：修改姓名
-    elif re.match(r"更改\s+\d+\s+\S+\s+\S", text):
-        reply = cmd_admin_rename(gid, uid, text)
-
-    # ── 推播設定
-    elif text in ("推播設定", "/推播設定"):
-        reply = cmd_show_settings()
-
-    elif re.match(r"設定推播\s+\d", text):
-        reply = cmd_set_broadcast_time(text)
-
-    elif re.match(r"設定靜音\s+\d+\s+\d+$", text):
-        reply = cmd_set_quiet(text)
-
-    elif re.match(r"設定推播門檻\s+\d+$", text):
-        reply = cmd_set_threshold(text)
-
-    elif re.match(r"設定推播間隔\s+\d", text):
-        reply = cmd_set_interval(text)
-
-    # ── 說明（只有負責人輸入「接龍說明」才顯示）
-    elif text in ("接龍說明",):
-        active = get_active_list(gid)
-        if active and active[3] == uid:
-            reply = HELP_TEXT
-        elif not active:
-            reply = HELP_TEXT
-        else:
-            reply = "此指令僅限負責人使用。"
+    # ── 退出／force 清除／清除／幫報／移除／更改／推播設定：依第一個詞查表
+    #    （這些關鍵字彼此不重疊，也不會被上面的分支攔截，查表不影響原本的優先順序）
+    else:
+        prefix = _PREFIX_CMDS.get(text.split(None, 1)[0].lower()) if text else None
+        if prefix and prefix[0].match(text):
+            reply = prefix[1](gid, uid, text, event)
 
     # ── NLU fallback：無法匹配任何指令時，嘗試用 AI 理解
     if reply is None and claude_client and len(text) >= 2 and len(text) <= 200:
-        if not re.match(r'^[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\s]+$', text):
+        if not EMOJI_ONLY_RE.match(text):
             try:
-                reply = cmd_nlu_join(gid, uid, lazy_name(), text)
+                reply = cmd_nlu_join(gid, uid, get_user_name(event, gid, uid), text)
                 if reply:
-                    logger.info(f"[nlu] AI 處理成功")
+                    logger.info("[nlu] AI 處理成功")
             except Exception as e:
-                logger.error(f"[nlu] 錯誤: {e}")
+                logger.error("[nlu] 錯誤: %s", e)
 
-    logger.info(f"[msg] reply={'（無）' if reply is None else repr(reply[:40])}")
+    if reply is None:
+        logger.info("[msg] reply=（無）")
+    else:
+        logger.info("[msg] reply=%r", reply[:40])
 
     if reply:
         # LINE 文字訊息上限 5000 字
@@ -2049,7 +2291,7 @@ def handle_message(event):
         try:
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
         except Exception as e:
-            logger.error(f"[reply] 失敗: {e}")
+            logger.error("[reply] 失敗: %s", e)
 
 
 @handler.add(JoinEvent)
@@ -2064,7 +2306,7 @@ def handle_join(event):
     try:
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text=msg))
     except Exception as e:
-        logger.error(f"[Join] 失敗: {e}")
+        logger.error("[Join] 失敗: %s", e)
 
 
 # ══════════════════════════════════════════
@@ -2081,24 +2323,57 @@ def handle_join(event):
 # 啟動初始化（模組層級）
 # ══════════════════════════════════════════
 
+_started      = False
+_started_lock = threading.Lock()
+
+_OPTIMIZE_EVERY   = 15 * 60   # 秒：PRAGMA optimize 間隔
+_CHECKPOINT_EVERY = 60 * 60   # 秒：WAL checkpoint 間隔
+
+def _db_maintenance_loop():
+    """定期更新查詢計畫統計（PRAGMA optimize）並截斷 WAL 檔，避免 WAL 無限制成長"""
+    conn = get_conn()
+    last_checkpoint = time.monotonic()
+    while True:
+        time.sleep(_OPTIMIZE_EVERY)
+        try:
+            conn.execute("PRAGMA optimize")
+            if time.monotonic() - last_checkpoint >= _CHECKPOINT_EVERY:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                last_checkpoint = time.monotonic()
+        except Exception as e:
+            logger.warning("[db] 維護失敗: %s", e)
+
 def _startup():
-    """模組載入時：在背景執行緒初始化 DB（避免阻塞 port 綁定）"""
+    """在背景執行緒初始化 DB（避免阻塞 port 綁定）；重複呼叫只執行一次，實際啟動時回傳 True
+    直接執行／flask 啟動時於模組載入時呼叫；Gunicorn 下改由 worker 的 post_worker_init 呼叫，
+    master process 不開資料庫（沒有這個 hook 時由 _ensure_db() 在第一次查詢時補上）"""
+    global _started
+    # 檢查與設定在同一把鎖內：多個請求執行緒同時走 _ensure_db() 也只會啟動一條維護執行緒
+    with _started_lock:
+        if _started:
+            return False
+        _started = True
 
     def _delayed_init():
         import time
         time.sleep(3)
         try:
-            init_db()
+            _ensure_db()
             logger.info("[startup] 資料庫初始化完成")
         except Exception as e:
-            logger.error(f"[startup] 資料庫初始化失敗: {e}")
+            logger.error("[startup] 資料庫初始化失敗: %s", e)
+            return
+        # 初始化完成後，同一條背景執行緒接著做定期資料庫維護
+        _db_maintenance_loop()
 
     t = threading.Thread(target=_delayed_init, daemon=True)
     t.start()
     logger.info("[startup] 背景初始化執行緒已啟動")
+    return True
 
 
-_startup()
+if "gunicorn" not in os.environ.get("SERVER_SOFTWARE", ""):
+    _startup()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,26 @@
 """
 Gunicorn 設定檔
-標記 worker process，讓 _start_scheduler_once 知道自己在 worker 裡
-（排程器由 app.py 的 background thread 延遲啟動，不在 hook 裡呼叫）
+標記 worker process，並在 worker 內啟動 app 的背景初始化
+（master process 只負責 preload 載入程式碼，不開資料庫）
 """
 import os
 
+# ── 伺服器設定（render.yaml 與 README 的啟動指令都讀這裡）
+# 只開 1 個 worker：推播設定、進行中接龍、「列表」文字都快取在 process 內，
+# 多個 worker 彼此看不到對方的更新；併發改由 gthread 執行緒處理（webhook 大多在等 LINE API）
+workers      = 1
+worker_class = "gthread"
+threads      = 4
+timeout      = 120
+preload_app  = True   # master 先載入程式碼，worker fork 後共用（copy-on-write）
+
 
 def post_fork(server, worker):
     """每個 worker process fork 後設定標記"""
     os.environ["GUNICORN_WORKER"] = "1"
+
+
+def post_worker_init(worker):
+    """worker 載入 app 後才初始化資料庫（_startup 重複呼叫只會執行一次）"""
+    import app
+    app._startup()